@@ -0,0 +1,105 @@
+import os, sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
+from task4.worklist import flip_cfg
+from task5.immediate_dominators import immediate_dominators, dominator_tree_from_idom, Dominators
+from task5.dominance_frontier import dominance_frontier
+from task8.natural_loops import LoopForest
+from driver import ir
+
+# analysis name -> function(analyses) computing it from other analyses
+ANALYSES = {}
+
+# everything that only depends on the shape of the CFG, not on the
+# instructions inside the blocks; passes that only rewrite instructions
+# in place (without adding, removing or emptying blocks) preserve these
+CFG_ANALYSES = ("cfg", "reachable_cfg", "preds", "idom", "dominators",
+                "dom_tree", "dom_frontier", "loop_forest", "loops")
+
+def analysis(name):
+    def wrap(fn):
+        ANALYSES[name] = fn
+        return fn
+    return wrap
+
+# blocks of whichever form func is in: bril JSON or a driver.ir.Function
+@analysis("blocks")
+def _blocks(am):
+    if isinstance(am.func, ir.Function):
+        return ir.basic_blocks(am.func.instrs)
+    return basic_blocks(am.func["instrs"], quiet=True)
+
+@analysis("cfg")
+def _cfg(am):
+    if isinstance(am.func, ir.Function):
+        return ir.cfg(*am.get("blocks"))
+    return cfg(*am.get("blocks"))
+
+@analysis("reachable_cfg")
+def _reachable_cfg(am):
+    return reachable_cfg(am.get("cfg"), am.entry)
+
+@analysis("preds")
+def _preds(am):
+    return flip_cfg(am.get("reachable_cfg"))
+
+# (rpo, idom) as returned by immediate_dominators
+@analysis("idom")
+def _idom(am):
+    return immediate_dominators(am.get("reachable_cfg"), am.entry)
+
+# lazily derived sets, usable wherever the dict from dominators() is
+@analysis("dominators")
+def _dominators(am):
+    return Dominators(*am.get("idom"))
+
+@analysis("dom_tree")
+def _dom_tree(am):
+    return dominator_tree_from_idom(*am.get("idom"))
+
+@analysis("dom_frontier")
+def _dom_frontier(am):
+    return dominance_frontier(am.get("reachable_cfg"), am.get("dominators"),
+                              am.get("dom_tree"), am.entry)
+
+@analysis("loop_forest")
+def _loop_forest(am):
+    return LoopForest(am.get("reachable_cfg"), am.get("dominators"), am.entry)
+
+# (header, blocks) of every natural loop, as returned by natural_loops
+@analysis("loops")
+def _loops(am):
+    return [(l.header, l.blocks) for l in am.get("loop_forest").loops]
+
+class FunctionAnalyses:
+    """Lazily computed, memoized analyses of a single function.
+
+    Analyses are computed on first request and cached until a pass
+    invalidates them. Blocks are indexed as in basic_blocks and the entry
+    block is assumed to be block 0.
+    """
+    def __init__(self, func, entry=0):
+        self.func = func
+        self.entry = entry
+        self.cache = {}
+
+    def get(self, name):
+        if name not in self.cache:
+            self.cache[name] = ANALYSES[name](self)
+        return self.cache[name]
+
+    def set(self, name, value) -> None:
+        """Cache an analysis a pass has kept up to date itself."""
+        self.cache[name] = value
+
+    def invalidate(self, preserved=()) -> None:
+        """Drop every cached analysis that is not in preserved."""
+        self.cache = {n: a for n, a in self.cache.items() if n in preserved}
+
+    def switch(self, func) -> None:
+        """Analyse func, the same function in another form (bril JSON or a
+        driver.ir.Function), from now on. Only analyses of the CFG's shape
+        carry over; the blocks hold the old form's instructions."""
+        self.func = func
+        self.invalidate(CFG_ANALYSES)
@@ -0,0 +1,185 @@
+import os, sys, re, csv
+import argparse, glob, signal
+import subprocess, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python < 3.11
+    import tomli as tomllib
+
+DEFAULT_TIMEOUT = 5  # seconds per benchmark run, as in brench
+BASELINE = "baseline"
+
+class StageResult:
+    """Resource use of one command of a pipeline."""
+    def __init__(self, command, returncode, wall, max_rss_kb):
+        self.command = command
+        self.returncode = returncode
+        self.wall = wall
+        self.max_rss_kb = max_rss_kb
+
+class RunResult:
+    def __init__(self, benchmark, run, stdout="", stderr="", stages=(), timed_out=False):
+        self.benchmark = benchmark
+        self.run = run
+        self.stdout = stdout
+        self.stderr = stderr
+        self.stages = list(stages)
+        self.timed_out = timed_out
+
+    @property
+    def failed(self) -> bool:
+        return self.timed_out or any(s.returncode != 0 for s in self.stages)
+
+def benchmark_args(path) -> str:
+    """The arguments from a benchmark's "# ARGS:" line, if it has one."""
+    with open(path) as f:
+        for line in f:
+            m = re.match(r"\s*#\s*ARGS:(.*)", line)
+            if m:
+                return m.group(1).strip()
+    return ""
+
+def run_pipeline(commands, stdin_path, cwd, timeout) -> tuple:
+    """Run shell commands connected by pipes, stdin_path feeding the first.
+
+    Each command is its own process, so its wall time and peak RSS (from
+    wait4) can be reported separately. Everything is killed once timeout
+    seconds have passed.
+
+    Linux carries a process's peak RSS over fork and exec, so a stage's
+    peak RSS is never reported as less than this runner's own.
+
+    Returns:
+        (stdout of the last command, stderr of all of them, [StageResult],
+        whether the timeout was hit)
+    """
+    procs, errs, starts = [], [], []
+    with open(stdin_path) as stdin:
+        prev = stdin
+        for i, command in enumerate(commands):
+            err = tempfile.TemporaryFile()
+            starts.append(time.perf_counter())
+            proc = subprocess.Popen(command, shell=True, cwd=cwd, stdin=prev,
+                                    stdout=subprocess.PIPE, stderr=err,
+                                    start_new_session=True)
+            if i:
+                prev.close()  # only the next stage should hold the pipe open
+            prev = proc.stdout
+            procs.append(proc)
+            errs.append(err)
+
+    # reap each stage as soon as it exits, to time it on its own
+    finished = [None] * len(procs)
+    def reap(i, proc):
+        _, status, usage = os.wait4(proc.pid, 0)
+        finished[i] = (time.perf_counter(), status, usage)
+    waiters = [threading.Thread(target=reap, args=(i, proc)) for i, proc in enumerate(procs)]
+    for waiter in waiters:
+        waiter.start()
+
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        for proc, done in zip(procs, finished):
+            if done is None:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+    try:
+        stdout = procs[-1].stdout.read()
+        procs[-1].stdout.close()
+        for waiter in waiters:
+            waiter.join()
+    finally:
+        timer.cancel()
+    stages = []
+    for command, proc, start, (end, status, usage) in zip(commands, procs, starts, finished):
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in KiB on Linux
+        stages.append(StageResult(command, proc.returncode, end - start, usage.ru_maxrss))
+    stderr = b""
+    for err in errs:
+        err.seek(0)
+        stderr += err.read()
+        err.close()
+    return (stdout.decode(errors="replace"), stderr.decode(errors="replace"),
+            stages, timed_out.is_set())
+
+def run_benchmark(benchmark, path, run, pipeline, cwd, timeout) -> RunResult:
+    args = benchmark_args(path)
+    commands = [command.replace("{args}", args) for command in pipeline]
+    stdout, stderr, stages, timed_out = run_pipeline(commands, path, cwd, timeout)
+    return RunResult(benchmark, run, stdout, stderr, stages, timed_out)
+
+def result_value(result, extract, baseline) -> str:
+    """The figure of merit for one run, or why there isn't one."""
+    if result.timed_out:
+        return "timeout"
+    if baseline is not None and result is not baseline and result.stdout != baseline.stdout:
+        return "incorrect"
+    m = re.search(extract, result.stdout + result.stderr)
+    if result.failed or m is None:
+        return "missing"
+    return m.group(1)
+
+def load_config(path) -> dict:
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+def run_all(config, config_dir, jobs=None, timeout=None, runs=None) -> list:
+    """Run every run of every benchmark in config on a pool of jobs workers.
+
+    Returns:
+        The RunResults, in benchmark order and then run order.
+    """
+    timeout = timeout or config.get("timeout", DEFAULT_TIMEOUT)
+    run_names = [r for r in config["runs"] if runs is None or r in runs or r == BASELINE]
+    paths = sorted(glob.glob(os.path.join(config_dir, config["benchmarks"])))
+    tasks = [(os.path.splitext(os.path.basename(p))[0], p, r) for p in paths for r in run_names]
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(run_benchmark, name, path, r, config["runs"][r]["pipeline"],
+                               config_dir, timeout)
+                   for name, path, r in tasks]
+        return [f.result() for f in futures]
+
+def write_results(results, extract, out) -> None:
+    baselines = {r.benchmark: r for r in results if r.run == BASELINE}
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["benchmark", "run", "result"])
+    for r in results:
+        writer.writerow([r.benchmark, r.run, result_value(r, extract, baselines.get(r.benchmark))])
+
+def write_stats(results, out) -> None:
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["benchmark", "run", "stage", "command", "wall_s", "max_rss_kb", "returncode"])
+    for r in results:
+        for i, s in enumerate(r.stages):
+            writer.writerow([r.benchmark, r.run, i, s.command, f"{s.wall:.4f}",
+                             s.max_rss_kb, s.returncode])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmarks of a brench.toml concurrently")
+    parser.add_argument("config", help="brench.toml; paths and commands are relative to its directory")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="concurrent runs (default: all cores)")
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per run (default: the config's, or 5)")
+    parser.add_argument("--run", action="append", dest="runs", help="only these runs (and the baseline)")
+    parser.add_argument("-o", "--output", help="write the CSV here instead of stdout")
+    parser.add_argument("--stats", help="write per-stage wall time and peak RSS to this CSV")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    config_dir = os.path.dirname(os.path.abspath(args.config))
+    results = run_all(config, config_dir, args.jobs, args.timeout, args.runs)
+    if args.output:
+        with open(args.output, "w", newline="") as out:
+            write_results(results, config["extract"], out)
+    else:
+        write_results(results, config["extract"], sys.stdout)
+    if args.stats:
+        with open(args.stats, "w", newline="") as out:
+            write_stats(results, out)
@@ -0,0 +1,163 @@
+import os, sys, json
+import hashlib, tempfile
+from functools import lru_cache
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from driver.parallel import map_functions
+
+DEFAULT_MAX_BYTES = 256 << 20
+STATS_FILE = "stats.json"
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../'))
+
+def canonical(value) -> bytes:
+    """JSON with sorted keys and no whitespace, so equal values hash equally."""
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+@lru_cache(maxsize=None)
+def code_fingerprint(root=ROOT) -> str:
+    """Hash of every .py file under root, so editing a pass invalidates
+    everything it cached."""
+    h = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith((".", "__")))
+        for name in sorted(filenames):
+            if name.endswith(".py"):
+                path = os.path.join(dirpath, name)
+                h.update(os.path.relpath(path, root).encode() + b"\0")
+                with open(path, "rb") as f:
+                    h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+class FunctionCache:
+    """Optimized functions on disk, keyed by a hash of the function and the
+    pipeline that optimized it.
+
+    Each entry is the rewritten function as JSON, stored under the sha256 of
+    the pipeline description, the code of the passes and the canonical JSON
+    of the original function. Entries are written to a temporary file and
+    renamed into place, so processes can share a directory. A hit touches
+    the entry, and trim() removes the least recently used entries (oldest
+    mtime) until the directory fits in max_bytes.
+
+    Attributes:
+        hits, misses, stores, evictions: counts for this process.
+    """
+    def __init__(self, directory, pipeline, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.salt = canonical(pipeline) + code_fingerprint().encode()
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def key(self, func) -> str:
+        return hashlib.sha256(self.salt + canonical(func)).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.directory, key[:2], key[2:] + ".json")
+
+    def lookup(self, func) -> tuple:
+        """Returns:
+            (the key of func, its cached rewrite or None)
+        """
+        key = self.key(func)
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            # a corrupted entry is a miss too, and is replaced on store
+            cached = None
+        if cached is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, cached
+
+    def store(self, key, func) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(func, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.stores += 1
+
+    def entries(self) -> list:
+        """[(mtime, size, path)] of every entry."""
+        found = []
+        for sub in os.scandir(self.directory):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".json"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue  # trimmed by another process
+                    found.append((st.st_mtime, st.st_size, entry.path))
+        return found
+
+    def trim(self) -> None:
+        """Evict least recently used entries until the cache fits in max_bytes."""
+        if not os.path.isdir(self.directory):
+            return
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def save_stats(self) -> dict:
+        """Add this process's counts to the totals kept in the cache
+        directory, and return the new totals. Runs finishing at the same
+        moment can lose each other's counts."""
+        path = os.path.join(self.directory, STATS_FILE)
+        try:
+            with open(path) as f:
+                totals = json.load(f)
+        except (FileNotFoundError, ValueError):
+            totals = {}
+        for name in ("hits", "misses", "stores", "evictions"):
+            totals[name] = totals.get(name, 0) + getattr(self, name)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(totals, f)
+        os.replace(tmp, path)
+        return totals
+
+    def summary(self) -> str:
+        looked_up = self.hits + self.misses
+        rate = 100 * self.hits / looked_up if looked_up else 0
+        return (f"cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self.stores} stored, {self.evictions} evicted")
+
+def map_cached(cache, fn, functions, jobs=1, *args, pool=None) -> list:
+    """map_functions, except that functions found in cache are not
+    rewritten again, and the rewrites of the others are stored in it.
+
+    Lookups and stores happen in this process; only the misses are sent to
+    the workers.
+    """
+    results = []
+    misses = []
+    for func in functions:
+        key, cached = cache.lookup(func)
+        results.append(cached)
+        if cached is None:
+            misses.append((len(results) - 1, key, func))
+    rewritten = map_functions(fn, [func for _, _, func in misses], jobs, *args, pool=pool)
+    for (i, key, _), func in zip(misses, rewritten):
+        cache.store(key, func)
+        results[i] = func
+    return results
@@ -0,0 +1,187 @@
+from array import array
+
+# Opcodes are interned to small ints. The core, float, memory, SSA and
+# speculation extensions are numbered up front so their numbers are the same
+# in every process; anything else is appended the first time it is seen.
+OPCODES = [
+    "const", "id", "add", "sub", "mul", "div",
+    "eq", "lt", "gt", "le", "ge", "not", "and", "or",
+    "jmp", "br", "call", "ret", "print", "nop",
+    "fadd", "fsub", "fmul", "fdiv", "feq", "flt", "fgt", "fle", "fge",
+    "alloc", "free", "store", "load", "ptradd",
+    "get", "set", "undef",
+    "speculate", "commit", "guard",
+]
+OPCODE_NUMS = {op: i for i, op in enumerate(OPCODES)}
+
+def intern_op(op) -> int:
+    if op not in OPCODE_NUMS:
+        OPCODE_NUMS[op] = len(OPCODES)
+        OPCODES.append(op)
+    return OPCODE_NUMS[op]
+
+CONST, ID, JMP, BR, CALL, RET = (OPCODE_NUMS[op] for op in ("const", "id", "jmp", "br", "call", "ret"))
+GET, SET, UNDEF = OPCODE_NUMS["get"], OPCODE_NUMS["set"], OPCODE_NUMS["undef"]
+LABEL = -1   # op of a Label
+NO_VAR = -1  # dest of an instruction without a destination
+
+# the keys Instr keeps in slots; anything else goes in extra
+INSTR_KEYS = ("args", "dest", "funcs", "labels", "op", "type", "value")
+
+class Names:
+    """Interns the variable names of one function to consecutive small ints."""
+    __slots__ = ("nums", "names")
+
+    def __init__(self):
+        self.nums = {}
+        self.names = []
+
+    def num(self, name) -> int:
+        n = self.nums.get(name)
+        if n is None:
+            n = self.nums[name] = len(self.names)
+            self.names.append(name)
+        return n
+
+    def __len__(self):
+        return len(self.names)
+
+class Instr:
+    """A Bril instruction.
+
+    op is an interned opcode, dest an interned variable (NO_VAR if absent)
+    and args an array of interned variables. Absent args, funcs, labels,
+    type and value are None, so an instruction with "args": [] converts back
+    to exactly that. Keys Bril does not define (e.g. "pos") are kept in extra.
+    """
+    __slots__ = ("op", "dest", "type", "args", "funcs", "labels", "value", "extra")
+
+    def __init__(self, op, dest=NO_VAR, type=None, args=None, funcs=None,
+                 labels=None, value=None, extra=None):
+        self.op = op
+        self.dest = dest
+        self.type = type
+        self.args = args
+        self.funcs = funcs
+        self.labels = labels
+        self.value = value
+        self.extra = extra
+
+class Label:
+    __slots__ = ("label", "extra")
+    # so passes can check instr.op / instr.dest / instr.args without isinstance
+    op = LABEL
+    dest = NO_VAR
+    args = None
+
+    def __init__(self, label, extra=None):
+        self.label = label
+        self.extra = extra
+
+class Function:
+    __slots__ = ("name", "args", "type", "instrs", "names", "extra")
+
+    def __init__(self, name, args, type, instrs, names, extra=None):
+        self.name = name
+        self.args = args
+        self.type = type
+        self.instrs = instrs
+        self.names = names
+        self.extra = extra
+
+def instr_from_bril(inst, names):
+    if "label" in inst:
+        extra = {k: v for k, v in inst.items() if k != "label"} or None
+        return Label(inst["label"], extra)
+    num = names.num
+    extra = None
+    if len(inst.keys() - INSTR_KEYS):
+        extra = {k: v for k, v in inst.items() if k not in INSTR_KEYS}
+    args = inst.get("args")
+    return Instr(
+        intern_op(inst["op"]),
+        num(inst["dest"]) if "dest" in inst else NO_VAR,
+        inst.get("type"),
+        array("i", [num(a) for a in args]) if args is not None else None,
+        inst.get("funcs"),
+        inst.get("labels"),
+        inst.get("value"),
+        extra,
+    )
+
+def instr_to_bril(instr, names):
+    if instr.op == LABEL:
+        inst = {"label": instr.label}
+    else:
+        inst = {}
+        if instr.args is not None:
+            inst["args"] = [names[a] for a in instr.args]
+        if instr.dest != NO_VAR:
+            inst["dest"] = names[instr.dest]
+        if instr.funcs is not None:
+            inst["funcs"] = instr.funcs
+        if instr.labels is not None:
+            inst["labels"] = instr.labels
+        inst["op"] = OPCODES[instr.op]
+        if instr.type is not None:
+            inst["type"] = instr.type
+        if instr.value is not None:
+            inst["value"] = instr.value
+    if instr.extra:
+        inst.update(instr.extra)
+    return inst
+
+def from_bril(func) -> Function:
+    """Convert a function in bril JSON format to the internal IR."""
+    names = Names()
+    for a in func.get("args", []):
+        names.num(a["name"])
+    instrs = [instr_from_bril(inst, names) for inst in func["instrs"]]
+    extra = {k: v for k, v in func.items() if k not in ("name", "args", "type", "instrs")}
+    return Function(func["name"], func.get("args"), func.get("type"), instrs, names, extra or None)
+
+def to_bril(f) -> dict:
+    """Convert an IR function back to bril JSON; inverse of from_bril."""
+    names = f.names.names
+    func = {}
+    if f.args is not None:
+        func["args"] = f.args
+    func["instrs"] = [instr_to_bril(instr, names) for instr in f.instrs]
+    func["name"] = f.name
+    if f.type is not None:
+        func["type"] = f.type
+    if f.extra:
+        func.update(f.extra)
+    return func
+
+def blocks(instrs) -> list:
+    """Split IR instructions into basic blocks the same way basic_blocks does."""
+    blocks = [[]]
+    for instr in instrs:
+        if instr.op == LABEL and blocks[-1]:
+            blocks.append([])
+        blocks[-1].append(instr)
+        if instr.op == BR or instr.op == JMP:
+            blocks.append([])
+    return [b for b in blocks if b]
+
+def basic_blocks(instrs) -> tuple:
+    """(blocks, labels) of IR instructions, numbered as basic_blocks numbers
+    the blocks of the same function in bril JSON."""
+    bs = blocks(instrs)
+    labels = {b[0].label: i for i, b in enumerate(bs) if b[0].op == LABEL}
+    return bs, labels
+
+def cfg(blocks, labels) -> dict:
+    """The same graph task2's cfg builds, from IR blocks."""
+    graph = {}
+    last = len(blocks) - 1
+    for i, b in enumerate(blocks):
+        op = b[-1].op
+        if op == BR or op == JMP:
+            graph[i] = [labels[l] for l in b[-1].labels]
+        elif i < last and op != RET:
+            graph[i] = [i + 1]
+        else:
+            graph[i] = []
+    return graph
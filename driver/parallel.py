@@ -0,0 +1,59 @@
+from concurrent.futures import ProcessPoolExecutor
+
+# aim for a few chunks per worker so one big function doesn't leave the
+# other workers idle at the end
+CHUNKS_PER_JOB = 4
+
+def function_size(func) -> int:
+    return len(func.get("instrs", ())) + 1
+
+def make_chunks(functions, num_chunks) -> list:
+    """Split functions into contiguous chunks of roughly equal instruction count.
+
+    Returns a list of (start, end) index pairs covering functions in order.
+    A function larger than the target size gets a chunk to itself.
+    """
+    total = sum(function_size(f) for f in functions)
+    target = max(1, total // max(1, num_chunks))
+    chunks = []
+    start = size = 0
+    for i, func in enumerate(functions):
+        size += function_size(func)
+        if size >= target:
+            chunks.append((start, i + 1))
+            start, size = i + 1, 0
+    if start < len(functions):
+        chunks.append((start, len(functions)))
+    return chunks
+
+def apply_chunk(fn, functions, args) -> list:
+    for func in functions:
+        fn(func, *args)
+    return functions
+
+def map_functions(fn, functions, jobs=1, *args, pool=None) -> list:
+    """Call fn(func, *args) on every function, which it rewrites in place.
+
+    With jobs > 1, chunks of functions are sent to a pool of worker
+    processes, largest chunk first, and the rewritten functions come back
+    in their original order, so the output is identical to a serial run.
+    fn and args must be picklable (i.e. fn is a module-level function).
+    An existing executor can be passed as pool to avoid starting new
+    worker processes on every call.
+
+    Returns:
+        The list of rewritten functions. With jobs <= 1 this is functions
+        itself; otherwise it is a new list of new function dicts.
+    """
+    if jobs <= 1 or len(functions) <= 1:
+        return apply_chunk(fn, functions, args)
+    chunks = make_chunks(functions, jobs * CHUNKS_PER_JOB)
+    sizes = [sum(function_size(f) for f in functions[s:e]) for s, e in chunks]
+    if pool is None:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as pool:
+            return map_functions(fn, functions, jobs, *args, pool=pool)
+    futures = [None] * len(chunks)
+    for c in sorted(range(len(chunks)), key=lambda c: -sizes[c]):
+        s, e = chunks[c]
+        futures[c] = pool.submit(apply_chunk, fn, functions[s:e], args)
+    return [func for future in futures for func in future.result()]
@@ -0,0 +1,214 @@
+import os, sys, json
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task3.lvn.lvn import lvn_ir
+from task3.tdce.tdce import dce_ir
+from task3.gvn.gvn import gvn_func
+from task3.sccp.sccp import sccp_func
+from task6.toSSA import to_ssa_ir
+from task6.fromSSA import from_ssa_func, from_ssa_coalesce
+from task8.licm import licm_ir
+from task12.insert_trace import read_trace, trace_func
+from task12.hot_traces import hot_traces_func
+from driver.analysis import FunctionAnalyses, CFG_ANALYSES
+from driver.ir import from_bril, to_bril
+from driver.parallel import map_functions
+from driver.stream import stream_functions
+from driver.profile import PassProfiler, json_size, ir_size
+from driver.cache import FunctionCache
+
+# pass name -> function(func, options, am) that rewrites func in place
+PASSES = {}
+# pass name -> analyses that are still valid after the pass has run
+PRESERVES = {}
+# names of passes that take a driver.ir.Function instead of bril JSON
+IR_PASSES = set()
+
+def register(name, preserves=(), ir=False):
+    def wrap(fn):
+        PASSES[name] = fn
+        PRESERVES[name] = preserves
+        if ir:
+            IR_PASSES.add(name)
+        return fn
+    return wrap
+
+# lvn rewrites instructions one block at a time, never adding or emptying blocks
+@register("lvn", preserves=CFG_ANALYSES, ir=True)
+def lvn_pass(func, options, am):
+    lvn_ir(func, not options.no_semantics)
+
+@register("tdce", ir=True)
+def tdce_pass(func, options, am):
+    dce_ir(func)
+
+@register("to_ssa", ir=True)
+def to_ssa_pass(func, options, am):
+    to_ssa_ir(func, am)
+
+@register("to_ssa_pruned", ir=True)
+def to_ssa_pruned_pass(func, options, am):
+    to_ssa_ir(func, am, pruned=True)
+
+# from_ssa replaces gets and sets with ids one for one
+@register("from_ssa", preserves=CFG_ANALYSES)
+def from_ssa_pass(func, options, am):
+    from_ssa_func(func)
+
+# gvn expects SSA form, e.g. to_ssa,gvn,from_ssa
+@register("gvn")
+def gvn_pass(func, options, am):
+    gvn_func(func, am)
+
+@register("from_ssa_coalesce")
+def from_ssa_coalesce_pass(func, options, am):
+    from_ssa_coalesce(func)
+
+# sccp expects SSA form, e.g. to_ssa,sccp,from_ssa
+@register("sccp")
+def sccp_pass(func, options, am):
+    sccp_func(func, am)
+
+@register("licm", ir=True)
+def licm_pass(func, options, am):
+    licm_ir(func, am)
+
+@register("trace")
+def trace_pass(func, options, am):
+    func_name, trace = options.loaded_trace
+    trace_func(func, func_name, trace)
+
+@register("hot_traces")
+def hot_traces_pass(func, options, am):
+    hot_traces_func(func, options.loaded_counts, options.coverage)
+
+def parse_passes(spec) -> list:
+    """Split a comma-separated pass list and check every name is registered."""
+    names = [p.strip() for p in spec.split(",") if p.strip()]
+    for n in names:
+        if n not in PASSES:
+            raise ValueError(f"unknown pass {n!r}; choose from {', '.join(PASSES)}")
+    return names
+
+def run_passes(func, pass_names, options) -> None:
+    """Run the named passes in order on a single function.
+
+    Analyses are shared between passes and only recomputed after a pass
+    that does not preserve them. The function is converted to the internal
+    IR for IR passes and only converted back when a JSON pass (or the end of
+    the pipeline) needs it, so consecutive IR passes share one conversion;
+    analyses of the CFG's shape survive the conversions.
+    With options.profiler set, every pass is measured by its PassProfiler.
+    """
+    am = FunctionAnalyses(func)
+    profiler = getattr(options, "profiler", None)
+    ir_func = None
+    for name in pass_names:
+        if name in IR_PASSES:
+            if ir_func is None:
+                ir_func = from_bril(func)
+                am.switch(ir_func)
+            target, size = ir_func, ir_size
+        else:
+            if ir_func is not None:
+                write_back(func, ir_func)
+                am.switch(func)
+                ir_func = None
+            target, size = func, json_size
+        if profiler is None:
+            PASSES[name](target, options, am)
+        else:
+            with profiler.measure(func["name"], name, lambda: size(target)):
+                PASSES[name](target, options, am)
+        am.invalidate(PRESERVES[name])
+    if ir_func is not None:
+        write_back(func, ir_func)
+
+def write_back(func, ir_func):
+    # update in place: the analysis manager holds on to func
+    func.clear()
+    func.update(to_bril(ir_func))
+
+def run_pipeline(full_bril, pass_names, options) -> dict:
+    """Run the named passes on every function of an already-parsed program.
+
+    None of the registered passes look across function boundaries, so the
+    whole pipeline is applied to one function before moving on to the next,
+    and with options.jobs > 1 functions are spread over worker processes.
+    """
+    full_bril["functions"] = map_functions(
+        run_passes, full_bril["functions"], getattr(options, "jobs", 1),
+        pass_names, options)
+    return full_bril
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        description="Run a list of optimization passes in a single process.")
+    parser.add_argument("passes", help="comma-separated pass list, e.g. lvn,tdce,licm")
+    parser.add_argument("--no_semantics", action="store_true",
+                        help="disable commutativity and copy propagation in lvn")
+    parser.add_argument("--trace", help="trace file for the trace pass")
+    parser.add_argument("--counts", help="block and edge counts (interp/brili.py --profile) "
+                                          "for the hot_traces pass")
+    parser.add_argument("--coverage", type=float, default=0.9,
+                        help="fraction of dynamic instructions hot_traces should cover")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes to spread functions over")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="record time, IR size and solver counts of each pass "
+                             "as JSON lines (or CSV if FILE ends in .csv)")
+    parser.add_argument("--profile_memory", action="store_true",
+                        help="also record tracemalloc peak memory (slower)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="reuse functions optimized by an earlier run with the same "
+                             "passes and options, and store the ones that weren't")
+    parser.add_argument("--cache_size", type=int, default=256,
+                        help="MiB the cache may use before the least recently used "
+                             "functions are evicted")
+    parser.add_argument("--cache_stats", action="store_true",
+                        help="print cache hits and misses to stderr")
+    return parser
+
+def pipeline_description(args) -> dict:
+    """Everything besides the function itself that its optimized form
+    depends on, to key the cache with."""
+    return {"passes": args.pass_names, "no_semantics": args.no_semantics,
+            "trace": args.loaded_trace, "counts": args.loaded_counts,
+            "coverage": args.coverage}
+
+def load_options(args):
+    args.loaded_trace = read_trace(args.trace) if args.trace else None
+    if "trace" in args.pass_names and args.loaded_trace is None:
+        raise ValueError("the trace pass needs --trace")
+    args.loaded_counts = None
+    if args.counts:
+        with open(args.counts) as f:
+            args.loaded_counts = json.load(f)
+    if "hot_traces" in args.pass_names and args.loaded_counts is None:
+        raise ValueError("the hot_traces pass needs --counts")
+    args.profiler = PassProfiler(args.profile, args.profile_memory) if args.profile else None
+    if args.profiler is not None:
+        args.profiler.start_file()
+    args.function_cache = None
+    if args.cache:
+        args.function_cache = FunctionCache(args.cache, pipeline_description(args),
+                                            args.cache_size << 20)
+    return args
+
+if __name__ == "__main__":
+    parser = make_parser()
+    args = parser.parse_args()
+    try:
+        args.pass_names = parse_passes(args.passes)
+        load_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    # one function at a time from stdin to stdout, never the whole program
+    cache = args.function_cache
+    stream_functions(run_passes, args.jobs, args.pass_names, args, cache=cache)
+    if cache is not None:
+        cache.trim()
+        cache.save_stats()
+        if args.cache_stats:
+            print(cache.summary(), file=sys.stderr)
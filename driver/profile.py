@@ -0,0 +1,89 @@
+import os, sys, json, csv, io
+import time, tracemalloc
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks
+from task4 import counters
+from driver import ir
+
+# counters written as columns in CSV output (JSON lines get all of them)
+COUNTERS = ("worklist_iterations", "worklist_transfers", "idom_iterations",
+            "dominators_iterations")
+FIELDS = ("function", "pass", "wall_s", "peak_kib", "instrs_before", "instrs_after",
+          "blocks_before", "blocks_after") + COUNTERS
+
+def json_size(func) -> tuple:
+    """(instructions, basic blocks) of a Bril JSON function."""
+    blocks, _ = basic_blocks(func["instrs"], quiet=True)
+    return sum(1 for i in func["instrs"] if "op" in i), len(blocks)
+
+def ir_size(func) -> tuple:
+    """(instructions, basic blocks) of a driver.ir.Function."""
+    return sum(1 for i in func.instrs if i.op != ir.LABEL), len(ir.blocks(func.instrs))
+
+class PassProfiler:
+    """Records wall time, peak memory, IR size and solver counters of every
+    pass run on every function.
+
+    Records are appended to path as JSON lines, or as CSV if path ends in
+    .csv. Each record is a single write to a file opened for appending, so
+    worker processes (with --jobs) can share the file. Peak memory is the
+    tracemalloc peak above what was allocated when the pass started, only
+    measured with memory=True since tracing slows everything down.
+    """
+    def __init__(self, path, memory=False):
+        self.path = path
+        self.memory = memory
+        self.csv = path.endswith(".csv")
+        self.fd = None
+
+    def __getstate__(self):
+        # the file is opened again in each worker process
+        return {**self.__dict__, "fd": None}
+
+    def start_file(self) -> None:
+        """Truncate the output file and write the CSV header, if any."""
+        with open(self.path, "w", newline="") as f:
+            if self.csv:
+                csv.writer(f, lineterminator="\n").writerow(FIELDS)
+
+    def write(self, record) -> None:
+        if self.csv:
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator="\n").writerow(record.get(k, "") for k in FIELDS)
+            line = buf.getvalue()
+        else:
+            line = json.dumps(record) + "\n"
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self.fd, line.encode())
+
+    @contextmanager
+    def measure(self, function, pass_name, size):
+        """Profile the body of the with statement as one run of a pass.
+
+        size is called before and after to get the (instructions, blocks)
+        of the function being rewritten.
+        """
+        instrs_before, blocks_before = size()
+        outer, counters.active = counters.active, {}
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            counted, counters.active = counters.active, outer
+        record = {"function": function, "pass": pass_name, "wall_s": round(wall, 6)}
+        if self.memory:
+            record["peak_kib"] = (tracemalloc.get_traced_memory()[1] - base) // 1024
+        instrs_after, blocks_after = size()
+        record.update(instrs_before=instrs_before, instrs_after=instrs_after,
+                      blocks_before=blocks_before, blocks_after=blocks_after)
+        record.update(counted)
+        self.write(record)
@@ -0,0 +1,216 @@
+import os, sys, csv, gc, math
+import argparse, resource, time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
+from task4.live.live import live_vars
+from task4.reaching.reaching import reaching_defs
+from task5.dominators import dominators
+from task5.immediate_dominators import immediate_dominators, dominator_tree_from_idom, Dominators
+from task5.dominance_frontier import dominance_frontier
+from task6.toSSA import to_ssa_ir
+from task8.licm import licm_ir
+from driver.ir import from_bril
+from driver.synth import SHAPES, generate
+
+# sizes (in blocks), in steps of sqrt(10)
+DEFAULT_SIZES = [10, 32, 100, 316, 1000, 3162, 10000, 31623, 100000]
+DEFAULT_BUDGET = 10  # seconds; larger sizes of a stage are skipped past this
+MIN_FIT_TIME = 1e-4  # shorter timings are mostly noise, left out of the fit
+TAIL = 3  # the largest sizes, where asymptotic behaviour shows, are fit again
+
+def _cfg_of(func):
+    blocks, labels = basic_blocks(func["instrs"], quiet=True)
+    return reachable_cfg(cfg(blocks, labels), 0)
+
+# each stage does its untimed setup and returns the callable to time;
+# passes that rewrite func get their own conversion of it to the IR
+
+def _basic_blocks(func):
+    return lambda: basic_blocks(func["instrs"], quiet=True)
+
+def _cfg(func):
+    blocks, labels = basic_blocks(func["instrs"], quiet=True)
+    return lambda: cfg(blocks, labels)
+
+def _liveness(func):
+    return lambda: live_vars(func)
+
+def _reaching_defs(func):
+    return lambda: reaching_defs(func, quiet=True)
+
+def _dominators(func):
+    graph = _cfg_of(func)
+    return lambda: dominators(graph, 0)
+
+def _idom(func):
+    graph = _cfg_of(func)
+    return lambda: immediate_dominators(graph, 0)
+
+def _dominance_frontier(func):
+    graph = _cfg_of(func)
+    rpo, idom = immediate_dominators(graph, 0)
+    dom, tree = Dominators(rpo, idom), dominator_tree_from_idom(rpo, idom)
+    return lambda: dominance_frontier(graph, dom, tree, 0)
+
+def _to_ssa(func):
+    func = from_bril(func)
+    return lambda: to_ssa_ir(func, pruned=True)
+
+def _licm(func):
+    func = from_bril(func)
+    return lambda: licm_ir(func)
+
+STAGES = {
+    "basic_blocks": _basic_blocks,
+    "cfg": _cfg,
+    "liveness": _liveness,
+    "reaching_defs": _reaching_defs,
+    "dominators": _dominators,
+    "idom": _idom,
+    "dominance_frontier": _dominance_frontier,
+    "to_ssa": _to_ssa,
+    "licm": _licm,
+}
+
+def time_stage(stage, func, repeat) -> float:
+    """Best of repeat timings of one stage on func, in seconds.
+
+    The garbage collector is off while timing, as in timeit, so collections
+    triggered by earlier allocations don't land in the measurement.
+    """
+    best = math.inf
+    for _ in range(repeat):
+        run = STAGES[stage](func)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+def fit(points) -> tuple:
+    """Least-squares fit of log(time) = k log(blocks) + c.
+
+    Returns:
+        (k, r squared), or None with fewer than three usable points.
+    """
+    points = [(math.log(n), math.log(t)) for n, t in points if t >= MIN_FIT_TIME]
+    if len(points) < 3:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    sxy = sum((x - mx) * (y - my) for x, y in points)
+    syy = sum((y - my) ** 2 for _, y in points)
+    k = sxy / sxx
+    r2 = sxy * sxy / (sxx * syy) if syy else 1.0
+    return k, r2
+
+def measure(shapes, stages, sizes, width=4, repeat=3, budget=DEFAULT_BUDGET, log=None) -> list:
+    """Time every stage on every shape at increasing sizes.
+
+    Once a stage takes longer than budget seconds (or runs out of memory)
+    on a shape, it is not run on the larger sizes of that shape. Any other
+    exception propagates.
+
+    Returns:
+        [(shape, stage, blocks, instrs, seconds or an error message)]
+    """
+    rows = []
+    for shape in shapes:
+        live = list(stages)
+        for size in sizes:
+            if not live:
+                break
+            func = generate(shape, size, width)
+            blocks = len(basic_blocks(func["instrs"], quiet=True)[0])
+            instrs = sum(1 for i in func["instrs"] if "op" in i)
+            for stage in list(live):
+                try:
+                    result = time_stage(stage, func, repeat)
+                except MemoryError as e:
+                    result = type(e).__name__
+                rows.append((shape, stage, blocks, instrs, result))
+                if log:
+                    log(shape, stage, blocks, result)
+                if isinstance(result, str) or result > budget:
+                    live.remove(stage)
+    return rows
+
+def fits(rows) -> dict:
+    """(shape, stage) -> (fit of every size, fit of the TAIL largest sizes),
+    from the rows of measure.
+
+    Small sizes are dominated by constant overheads, so a superlinear stage
+    can fit close to linear overall; the tail fit is the one to watch.
+    """
+    points = {}
+    for shape, stage, blocks, _, result in rows:
+        points.setdefault((shape, stage), [])
+        if not isinstance(result, str):
+            points[(shape, stage)].append((blocks, result))
+    return {key: (fit(p), fit(p[-TAIL:])) for key, p in points.items()}
+
+def print_progress(shape, stage, blocks, result):
+    shown = result if isinstance(result, str) else f"{result:.4f}s"
+    print(f"{shape:>12} {stage:>18} {blocks:>8} {shown}", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the analyses and passes on synthetic CFGs of growing size "
+                    "and fit each to time ~ blocks^k")
+    parser.add_argument("--shape", action="append", choices=SHAPES, help="only these shapes")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="only these stages")
+    parser.add_argument("--sizes", type=lambda s: [int(n) for n in s.split(",")],
+                        default=DEFAULT_SIZES, help="comma-separated block counts")
+    parser.add_argument("--max_size", type=int, default=None,
+                        help="extend the sizes by powers of sqrt(10) up to this (e.g. 1000000)")
+    parser.add_argument("--width", type=int, default=4, help="filler instructions per block")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many timings")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                        help="seconds after which a stage stops growing")
+    parser.add_argument("--max_exponent", type=float, default=None,
+                        help="exit with status 1 if any tail exponent is above this")
+    parser.add_argument("--max_memory", type=int, default=None,
+                        help="address space limit in MiB, so a blow-up is recorded as a "
+                             "MemoryError instead of getting the process killed")
+    parser.add_argument("-o", "--output", help="write every timing to this CSV")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress on stderr")
+    args = parser.parse_args()
+
+    sizes = list(args.sizes)
+    if args.max_size:
+        step = round(2 * math.log10(sizes[-1])) + 1
+        while round(10 ** (step / 2)) <= args.max_size:
+            sizes.append(round(10 ** (step / 2)))
+            step += 1
+
+    if args.max_memory:
+        limit = args.max_memory << 20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    rows = measure(args.shape or list(SHAPES), args.stage or list(STAGES), sizes, args.width,
+                   args.repeat, args.budget, None if args.quiet else print_progress)
+
+    if args.output:
+        with open(args.output, "w", newline="") as out:
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(["shape", "stage", "blocks", "instrs", "seconds"])
+            for shape, stage, blocks, instrs, result in rows:
+                writer.writerow([shape, stage, blocks, instrs,
+                                 result if isinstance(result, str) else f"{result:.6f}"])
+
+    too_steep = []
+    print(f"{'shape':<12} {'stage':<18} {'k':>6} {'r^2':>6} {'k_tail':>6}")
+    for (shape, stage), (overall, tail) in fits(rows).items():
+        k, r2 = (f"{overall[0]:.2f}", f"{overall[1]:.3f}") if overall else ("-", "-")
+        k_tail = f"{tail[0]:.2f}" if tail else "-"
+        print(f"{shape:<12} {stage:<18} {k:>6} {r2:>6} {k_tail:>6}")
+        if args.max_exponent is not None and tail and tail[0] > args.max_exponent:
+            too_steep.append(f"{shape}/{stage}")
+    if too_steep:
+        print(f"tail exponent above {args.max_exponent}: {', '.join(too_steep)}", file=sys.stderr)
+        sys.exit(1)
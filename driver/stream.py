@@ -0,0 +1,152 @@
+import os, sys, json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from driver.parallel import map_functions, CHUNKS_PER_JOB
+from driver.cache import map_cached
+
+READ_SIZE = 1 << 16
+WHITESPACE = " \t\n\r"
+
+class ProgramReader:
+    """Read a Bril JSON program from a file one top-level member at a time.
+
+    Iterating yields (key, value) pairs in file order. For "functions" the
+    value is an iterator over the function objects, which only holds one
+    function in memory at a time and must be exhausted before moving on to
+    the next member; every other value is parsed whole.
+    """
+    def __init__(self, fp, read_size=READ_SIZE):
+        self.fp = fp
+        self.read_size = read_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size) -> bool:
+        """Read at least one more chunk (of at least size chars); False at EOF."""
+        if self.eof:
+            return False
+        data = self.fp.read(max(size, self.read_size))
+        if not data:
+            self.eof = True
+            return False
+        # drop what has been consumed so the buffer doesn't keep growing
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ("" at EOF)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.fill(0):
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars) -> str:
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError(f"expected one of {chars!r} in Bril JSON, got {c!r}")
+        self.pos += 1
+        return c
+
+    def value(self):
+        """Decode the next JSON value, reading more input until it is complete."""
+        self.peek()
+        want = self.read_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # a number could continue past the end of the buffer
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # double the read so huge values aren't re-parsed once per chunk
+            self.fill(want)
+            want *= 2
+
+    def functions(self):
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+    def __iter__(self):
+        self.expect("{")
+        if self.peek() == "}":
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            if key == "functions":
+                funcs = self.functions()
+                yield key, funcs
+                for _ in funcs: # skip whatever the caller didn't consume
+                    pass
+            else:
+                yield key, self.value()
+            if self.expect(",}") == "}":
+                return
+
+def batches(it, size):
+    it = iter(it)
+    while batch := list(islice(it, size)):
+        yield batch
+
+def write_program(members, out, fn, args=(), jobs=1, cache=None) -> None:
+    """Write (key, value) members as compact JSON, rewriting each function.
+
+    fn(func, *args) rewrites one function in place. Functions are written as
+    soon as they are processed (with jobs > 1, a batch at a time), and the
+    output is byte for byte what json.dumps gives for the whole program.
+    With a driver.cache.FunctionCache, functions it already holds are taken
+    from it instead of being rewritten.
+    """
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        out.write("{")
+        for i, (key, value) in enumerate(members):
+            if i:
+                out.write(", ")
+            out.write(json.dumps(key) + ": ")
+            if key != "functions":
+                out.write(json.dumps(value))
+                continue
+            out.write("[")
+            first = True
+            for batch in batches(value, max(1, jobs * CHUNKS_PER_JOB)):
+                if cache is None:
+                    rewritten = map_functions(fn, batch, jobs, *args, pool=pool)
+                else:
+                    rewritten = map_cached(cache, fn, batch, jobs, *args, pool=pool)
+                for func in rewritten:
+                    if not first:
+                        out.write(", ")
+                    first = False
+                    out.write(json.dumps(func))
+            out.write("]")
+        out.write("}\n")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def stream_functions(fn, jobs=1, *args, infile=None, outfile=None, cache=None) -> None:
+    """Run fn(func, *args) on every function of a program streamed from
+    infile (stdin by default) to outfile (stdout by default).
+
+    Peak memory is bounded by the largest function (times the batch size
+    with jobs > 1) rather than the size of the whole program.
+    """
+    infile = sys.stdin if infile is None else infile
+    outfile = sys.stdout if outfile is None else outfile
+    write_program(ProgramReader(infile), outfile, fn, args, jobs, cache)
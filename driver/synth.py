@@ -0,0 +1,132 @@
+import os, sys, json
+import argparse, random
+
+# ops used for the filler instructions in every block
+ARITH_OPS = ("add", "sub", "mul")
+NUM_VARS = 8
+# straight-line blocks are this many times longer than the others
+STRAIGHT_WIDTH = 8
+
+class Builder:
+    """Emits the instructions of one synthetic function."""
+    def __init__(self, seed, width, num_vars=NUM_VARS):
+        self.rng = random.Random(seed)
+        self.width = width
+        self.vars = [f"v{i}" for i in range(num_vars)]
+        self.instrs = [{"op": "const", "dest": v, "type": "int", "value": i}
+                       for i, v in enumerate(self.vars)]
+        self.instrs.append({"op": "const", "dest": "one", "type": "int", "value": 1})
+        self.fresh = 0
+
+    def label(self, name) -> None:
+        self.instrs.append({"label": name})
+
+    def body(self, width=None) -> None:
+        """width random arithmetic instructions over the variable pool."""
+        for _ in range(self.width if width is None else width):
+            dest, a, b = (self.rng.choice(self.vars) for _ in range(3))
+            self.instrs.append({"op": self.rng.choice(ARITH_OPS), "dest": dest,
+                                "type": "int", "args": [a, b]})
+
+    def cond(self) -> str:
+        """A new bool comparing two variables of the pool."""
+        dest = f"c{self.fresh}"
+        self.fresh += 1
+        a, b = self.rng.sample(self.vars, 2)
+        self.instrs.append({"op": "lt", "dest": dest, "type": "bool", "args": [a, b]})
+        return dest
+
+    def br(self, cond, then, other) -> None:
+        self.instrs.append({"op": "br", "args": [cond], "labels": [then, other]})
+
+    def jmp(self, target) -> None:
+        self.instrs.append({"op": "jmp", "labels": [target]})
+
+    def function(self, name) -> dict:
+        self.instrs.append({"op": "print", "args": list(self.vars)})
+        return {"name": name, "instrs": self.instrs}
+
+def loop_nest(b, n) -> None:
+    """Loops nested as deep as fits in n blocks: each has a header, a body
+    falling into the next loop in, and a latch after the inner loop exits."""
+    depth = max(1, (n - 1) // 3)
+    for i in range(depth):
+        b.label(f"h{i}")
+        b.br(b.cond(), f"b{i}", f"x{i}")
+        b.label(f"b{i}")
+        b.body()
+    b.jmp(f"h{depth - 1}")
+    # x{i} is where loop i exits to, i.e. the latch of loop i - 1
+    for i in reversed(range(depth)):
+        b.label(f"x{i}")
+        b.body()
+        if i:
+            b.instrs.append({"op": "add", "dest": b.vars[i % len(b.vars)], "type": "int",
+                             "args": [b.vars[i % len(b.vars)], "one"]})
+            b.jmp(f"h{i - 1}")
+
+def switch(b, n) -> None:
+    """A switch lowered to a chain of compare-and-branch blocks, one case
+    block per comparison, every case jumping to a shared end block."""
+    cases = max(1, (n - 2) // 2)
+    b.label("c0")
+    for i in range(cases):
+        if i:
+            b.label(f"c{i}")
+        b.instrs.append({"op": "const", "dest": "k", "type": "int", "value": i})
+        b.instrs.append({"op": "eq", "dest": "t", "type": "bool", "args": [b.vars[0], "k"]})
+        b.br("t", f"a{i}", f"c{i + 1}")
+        b.label(f"a{i}")
+        b.body()
+        b.jmp("end")
+    b.label(f"c{cases}")
+    b.body()
+    b.label("end")
+
+def irreducible(b, n) -> None:
+    """A chain of two-block cycles, each entered at both of its blocks, so
+    no block of a cycle dominates the other."""
+    for i in range(max(1, (n - 1) // 3)):
+        b.label(f"u{i}")
+        b.br(b.cond(), f"p{i}", f"q{i}")
+        b.label(f"p{i}")
+        b.body()
+        b.label(f"q{i}")
+        b.body()
+        b.br(b.cond(), f"p{i}", f"u{i + 1}")
+    b.label(f"u{max(1, (n - 1) // 3)}")
+
+def straight(b, n) -> None:
+    """Labelled blocks falling into each other, each a long run of
+    arithmetic."""
+    for i in range(max(1, n - 1)):
+        b.label(f"s{i}")
+        b.body(b.width * STRAIGHT_WIDTH)
+
+# shape name -> function(builder, blocks) emitting the body of the function
+SHAPES = {
+    "loop_nest": loop_nest,
+    "switch": switch,
+    "irreducible": irreducible,
+    "straight": straight,
+}
+
+def generate(shape, blocks, width=4, seed=0) -> dict:
+    """A Bril function of the given shape with about the given number of
+    basic blocks, each holding width filler instructions.
+
+    The same arguments always give the same function.
+    """
+    b = Builder(seed, width)
+    SHAPES[shape](b, blocks)
+    return b.function("main")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a synthetic Bril program as JSON")
+    parser.add_argument("shape", choices=SHAPES)
+    parser.add_argument("blocks", type=int, help="approximate number of basic blocks")
+    parser.add_argument("--width", type=int, default=4, help="filler instructions per block")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    json.dump({"functions": [generate(args.shape, args.blocks, args.width, args.seed)]}, sys.stdout)
+    print()
@@ -0,0 +1,509 @@
+import os, sys, json
+import argparse
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks
+
+INT_MIN, INT_MAX = -2**63, 2**63 - 1
+
+class BrilError(Exception):
+    """A run-time error in the interpreted program (brili exits with 2)."""
+
+def wrap(n) -> int:
+    """Wrap an int to 64-bit two's complement."""
+    if INT_MIN <= n <= INT_MAX:
+        return n
+    return (n - INT_MIN) % 2**64 + INT_MIN
+
+def int_div(a, b) -> int:
+    if b == 0:
+        raise BrilError("division by zero")
+    # truncates towards zero, unlike //
+    q = abs(a) // abs(b)
+    return wrap(q if (a < 0) == (b < 0) else -q)
+
+def fdiv(a, b) -> float:
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return float("nan")
+        return float("inf") if (a > 0) == (str(b)[0] != "-") else float("-inf")
+
+def format_value(v) -> str:
+    """Format a value the way brili's print does."""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, float):
+        if v != v:
+            return "NaN"
+        if v in (float("inf"), float("-inf")):
+            return "Infinity" if v > 0 else "-Infinity"
+        if v == 0 and str(v)[0] == "-":
+            return "-0"
+        return "%.17f" % v
+    if isinstance(v, Pointer):
+        return repr(v)
+    return str(v)
+
+class Undefined:
+    """The value of an undef'd variable: it can be passed around (e.g. by
+    set and get on a path that never uses it) but not used. Instructions
+    that use an operand check for it with `is UNDEFINED` when fetching it."""
+    def __repr__(self):
+        return "undefined"
+
+UNDEFINED = Undefined()
+
+def undefined_use(name) -> BrilError:
+    return BrilError(f"use of undefined value {name}")
+
+class Env(dict):
+    """The variables of a call, raising BrilError when one that was never
+    assigned is read."""
+    __slots__ = ()
+
+    def __missing__(self, name):
+        raise BrilError(f"undefined variable {name}")
+
+class Pointer:
+    __slots__ = ("base", "offset")
+
+    def __init__(self, base, offset):
+        self.base = base
+        self.offset = offset
+
+    def __repr__(self):
+        return f"Pointer({self.base}, {self.offset})"
+
+# instruction compilers: op -> function(instr, interp) returning a closure
+# run(env, frame). A closure returns None to go on to the next instruction,
+# or an action (see Frame) to transfer control.
+COMPILERS = {}
+
+def compiles(*ops):
+    def wrap_compiler(fn):
+        for op in ops:
+            COMPILERS[op] = fn
+        return fn
+    return wrap_compiler
+
+BINARY_OPS = {
+    "add": lambda a, b: wrap(a + b),
+    "sub": lambda a, b: wrap(a - b),
+    "mul": lambda a, b: wrap(a * b),
+    "div": int_div,
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "gt": lambda a, b: a > b,
+    "le": lambda a, b: a <= b,
+    "ge": lambda a, b: a >= b,
+    "and": lambda a, b: a and b,
+    "or": lambda a, b: a or b,
+    "fadd": lambda a, b: a + b,
+    "fsub": lambda a, b: a - b,
+    "fmul": lambda a, b: a * b,
+    "fdiv": fdiv,
+    "feq": lambda a, b: a == b,
+    "flt": lambda a, b: a < b,
+    "fgt": lambda a, b: a > b,
+    "fle": lambda a, b: a <= b,
+    "fge": lambda a, b: a >= b,
+}
+
+@compiles(*BINARY_OPS)
+def _binary(instr, interp):
+    fn = BINARY_OPS[instr["op"]]
+    dest = instr["dest"]
+    a, b = instr["args"]
+    def run(env, frame):
+        x, y = env[a], env[b]
+        if x is UNDEFINED or y is UNDEFINED:
+            raise undefined_use(a if x is UNDEFINED else b)
+        env[dest] = fn(x, y)
+    return run
+
+@compiles("not")
+def _not(instr, interp):
+    dest, (a,) = instr["dest"], instr["args"]
+    def run(env, frame):
+        x = env[a]
+        if x is UNDEFINED:
+            raise undefined_use(a)
+        env[dest] = not x
+    return run
+
+@compiles("id")
+def _id(instr, interp):
+    dest, (a,) = instr["dest"], instr["args"]
+    def run(env, frame):
+        env[dest] = env[a]
+    return run
+
+@compiles("const")
+def _const(instr, interp):
+    dest, value = instr["dest"], instr["value"]
+    if instr["type"] == "float":
+        value = float(value)
+    elif instr["type"] == "bool":
+        value = bool(value)
+    def run(env, frame):
+        env[dest] = value
+    return run
+
+@compiles("nop")
+def _nop(instr, interp):
+    def run(env, frame):
+        pass
+    return run
+
+@compiles("print")
+def _print(instr, interp):
+    args = instr.get("args", [])
+    out = interp.out
+    def run(env, frame):
+        values = [env[a] for a in args]
+        for a, x in zip(args, values):
+            if x is UNDEFINED:
+                raise undefined_use(a)
+        out.write(" ".join(map(format_value, values)) + "\n")
+    return run
+
+@compiles("jmp")
+def _jmp(instr, interp):
+    action = ("jump", instr["labels"][0])
+    def run(env, frame):
+        return action
+    return run
+
+@compiles("br")
+def _br(instr, interp):
+    (cond,) = instr["args"]
+    if_true, if_false = ("jump", instr["labels"][0]), ("jump", instr["labels"][1])
+    def run(env, frame):
+        x = env[cond]
+        if x is UNDEFINED:
+            raise undefined_use(cond)
+        return if_true if x else if_false
+    return run
+
+@compiles("ret")
+def _ret(instr, interp):
+    args = instr.get("args", [])
+    def run(env, frame):
+        return ("ret", env[args[0]] if args else None)
+    return run
+
+@compiles("call")
+def _call(instr, interp):
+    name, args, dest = instr["funcs"][0], instr.get("args", []), instr.get("dest")
+    def run(env, frame):
+        value = interp.call(name, [env[a] for a in args])
+        if dest is not None:
+            env[dest] = value
+    return run
+
+@compiles("alloc")
+def _alloc(instr, interp):
+    dest, (a,) = instr["dest"], instr["args"]
+    heap = interp.heap
+    def run(env, frame):
+        size = env[a]
+        if size is UNDEFINED:
+            raise undefined_use(a)
+        if size <= 0:
+            raise BrilError(f"cannot allocate {size} entries")
+        interp.next_base += 1
+        heap[interp.next_base] = [None] * size
+        env[dest] = Pointer(interp.next_base, 0)
+    return run
+
+def heap_cell(heap, ptr):
+    block = heap.get(ptr.base)
+    if block is None:
+        raise BrilError(f"{ptr!r} points to freed memory")
+    if not 0 <= ptr.offset < len(block):
+        raise BrilError(f"{ptr!r} is out of bounds")
+    return block
+
+@compiles("free")
+def _free(instr, interp):
+    (a,) = instr["args"]
+    heap = interp.heap
+    def run(env, frame):
+        ptr = env[a]
+        if ptr is UNDEFINED:
+            raise undefined_use(a)
+        if ptr.offset != 0 or ptr.base not in heap:
+            raise BrilError(f"cannot free {ptr!r}")
+        del heap[ptr.base]
+    return run
+
+@compiles("store")
+def _store(instr, interp):
+    p, v = instr["args"]
+    heap = interp.heap
+    def run(env, frame):
+        ptr = env[p]
+        if ptr is UNDEFINED:
+            raise undefined_use(p)
+        heap_cell(heap, ptr)[ptr.offset] = env[v]
+    return run
+
+@compiles("load")
+def _load(instr, interp):
+    dest, (p,) = instr["dest"], instr["args"]
+    heap = interp.heap
+    def run(env, frame):
+        ptr = env[p]
+        if ptr is UNDEFINED:
+            raise undefined_use(p)
+        value = heap_cell(heap, ptr)[ptr.offset]
+        if value is None:
+            raise BrilError(f"{ptr!r} points to uninitialized memory")
+        env[dest] = value
+    return run
+
+@compiles("ptradd")
+def _ptradd(instr, interp):
+    dest, (p, n) = instr["dest"], instr["args"]
+    def run(env, frame):
+        ptr, offset = env[p], env[n]
+        if ptr is UNDEFINED or offset is UNDEFINED:
+            raise undefined_use(p if ptr is UNDEFINED else n)
+        env[dest] = Pointer(ptr.base, ptr.offset + offset)
+    return run
+
+@compiles("set")
+def _set(instr, interp):
+    shadow, a = instr["args"]
+    def run(env, frame):
+        frame.shadow[shadow] = env[a]
+    return run
+
+@compiles("get")
+def _get(instr, interp):
+    dest = instr["dest"]
+    def run(env, frame):
+        if dest not in frame.shadow:
+            raise BrilError(f"get of {dest} with no value set")
+        env[dest] = frame.shadow[dest]
+    return run
+
+@compiles("undef")
+def _undef(instr, interp):
+    dest = instr["dest"]
+    def run(env, frame):
+        env[dest] = UNDEFINED
+    return run
+
+@compiles("speculate")
+def _speculate(instr, interp):
+    def run(env, frame):
+        frame.speculating.append((dict(env), dict(frame.shadow)))
+    return run
+
+@compiles("commit")
+def _commit(instr, interp):
+    def run(env, frame):
+        if not frame.speculating:
+            raise BrilError("commit outside of speculation")
+        frame.speculating.pop()
+    return run
+
+@compiles("guard")
+def _guard(instr, interp):
+    (cond,), action = instr["args"], ("abort", instr["labels"][0])
+    def run(env, frame):
+        x = env[cond]
+        if x is UNDEFINED:
+            raise undefined_use(cond)
+        if not x:
+            return action
+    return run
+
+class Frame:
+    """Per-call state besides the variables: the values passed by sets,
+    and a stack of (variables, set values) saved by speculate.
+
+    Actions returned by compiled instructions are ("jump", label),
+    ("ret", value) and ("abort", label) for a failed guard, which rolls
+    the variables back to the innermost speculate and jumps to label.
+    Memory and output are not rolled back.
+    """
+    __slots__ = ("shadow", "speculating")
+
+    def __init__(self):
+        self.shadow = {}
+        self.speculating = []
+
+class CompiledFunction:
+    """A function split into basic blocks (numbered as in basic_blocks) of
+    compiled instructions."""
+    def __init__(self, func, interp):
+        self.name = func["name"]
+        self.params = [a["name"] for a in func.get("args", [])]
+        blocks, labels = basic_blocks(func["instrs"], quiet=True)
+        self.labels = labels
+        self.code = []
+        for block in blocks:
+            ops = []
+            for instr in block:
+                if "op" not in instr:
+                    continue
+                if instr["op"] not in COMPILERS:
+                    raise BrilError(f"unknown op {instr['op']}")
+                ops.append(COMPILERS[instr["op"]](instr, interp))
+            self.code.append(ops)
+        self.block_counts = [0] * len(blocks)
+        self.edge_counts = {}
+
+class Interpreter:
+    """Runs a Bril program in process, counting every instruction executed
+    (like brili -p) and, per function, how often each basic block was
+    entered and each CFG edge taken.
+    """
+    def __init__(self, program, out=None):
+        self.out = sys.stdout if out is None else out
+        self.heap = {}
+        self.next_base = 0
+        self.total_dyn_inst = 0
+        self.functions = {}
+        for func in program["functions"]:
+            self.functions[func["name"]] = CompiledFunction(func, self)
+
+    def call(self, name, args):
+        func = self.functions.get(name)
+        if func is None:
+            raise BrilError(f"undefined function {name}")
+        if len(args) != len(func.params):
+            raise BrilError(f"{name} expects {len(func.params)} arguments, got {len(args)}")
+        env = Env(zip(func.params, args))
+        frame = Frame()
+        code, labels = func.code, func.labels
+        block_counts, edge_counts = func.block_counts, func.edge_counts
+        b = 0 if code else None
+        while b is not None:
+            block_counts[b] += 1
+            ops = code[b]
+            action = None
+            for op in ops:
+                action = op(env, frame)
+                if action is not None:
+                    break
+            if action is None:
+                self.total_dyn_inst += len(ops)
+                nxt = b + 1 if b + 1 < len(code) else None
+                if nxt is None:
+                    return None
+            else:
+                self.total_dyn_inst += len(ops) if op is ops[-1] else ops.index(op) + 1
+                kind, target = action
+                if kind == "ret":
+                    return target
+                if kind == "abort":
+                    if not frame.speculating:
+                        raise BrilError("guard failed outside of speculation")
+                    saved_env, frame.shadow = frame.speculating.pop()
+                    env.clear()
+                    env.update(saved_env)
+                if target not in labels:
+                    raise BrilError(f"undefined label {target}")
+                nxt = labels[target]
+            edge = (b, nxt)
+            edge_counts[edge] = edge_counts.get(edge, 0) + 1
+            b = nxt
+        return None
+
+    def run(self, args=()):
+        """Run main with args (already typed values) and check that all
+        memory was freed."""
+        self.call("main", list(args))
+        if self.heap:
+            raise BrilError("some memory locations have not been freed by the end of execution")
+
+    def profile(self) -> dict:
+        """Execution counts, as written by --profile.
+
+        Blocks are numbered as in basic_blocks (and FunctionAnalyses), and
+        edges are [from, to, count] triples.
+        """
+        return {
+            "total_dyn_inst": self.total_dyn_inst,
+            "functions": {
+                name: {
+                    "blocks": func.block_counts,
+                    "edges": [[u, v, n] for (u, v), n in sorted(func.edge_counts.items())],
+                }
+                for name, func in self.functions.items()
+            },
+        }
+
+def parse_args(program, argv) -> list:
+    """Convert command-line strings to main's argument types."""
+    main = next((f for f in program["functions"] if f["name"] == "main"), None)
+    if main is None:
+        raise BrilError("no main function")
+    params = main.get("args", [])
+    if len(params) != len(argv):
+        raise BrilError(f"main expects {len(params)} arguments, got {len(argv)}")
+    values = []
+    for param, arg in zip(params, argv):
+        if param["type"] == "int":
+            values.append(int(arg))
+        elif param["type"] == "float":
+            values.append(float(arg))
+        elif param["type"] == "bool":
+            if arg not in ("true", "false"):
+                raise BrilError(f"bad bool argument {arg}")
+            values.append(arg == "true")
+        else:
+            raise BrilError(f"main can't take {param['type']} arguments")
+    return values
+
+def run_program(program, argv=(), out=None) -> Interpreter:
+    """Run program's main on command-line style arguments and return the
+    Interpreter, which holds the counts. Raises BrilError on errors."""
+    interp = Interpreter(program, out)
+    interp.run(parse_args(program, list(argv)))
+    return interp
+
+def main(args) -> int:
+    program = json.load(sys.stdin)
+    interp = None
+    try:
+        interp = Interpreter(program)
+        interp.run(parse_args(program, args.args))
+        status = 0
+    except BrilError as e:
+        sys.stdout.flush()
+        print(f"error: {e}", file=sys.stderr)
+        status = 2
+    except RecursionError:
+        sys.stdout.flush()
+        print("error: call stack too deep", file=sys.stderr)
+        status = 2
+    sys.stdout.flush()
+    if status == 0:
+        if args.p:
+            print(f"total_dyn_inst: {interp.total_dyn_inst}", file=sys.stderr)
+        if args.profile:
+            with open(args.profile, "w") as f:
+                json.dump(interp.profile(), f)
+    return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bril interpreter")
+    parser.add_argument("-p", action="store_true", help="print total_dyn_inst to stderr")
+    parser.add_argument("--profile", help="write block and edge counts to this JSON file")
+    parser.add_argument("args", nargs="*")
+    args = parser.parse_args()
+    # deeply recursive programs need more than the default stack
+    sys.setrecursionlimit(1 << 20)
+    threading.stack_size(1 << 29)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(main(args)))
+    thread.start()
+    thread.join()
+    sys.exit(result[0] if result else 2)
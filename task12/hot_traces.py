@@ -0,0 +1,150 @@
+import os, sys, json
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks, cfg
+from task4.live.live import live_vars
+from task12.insert_trace import preprocess_trace, insert_traces
+from task12.optimize_trace import optimize_trace
+from driver.stream import stream_functions
+
+# speculation only rolls back variables, so traces stop before any block
+# that calls, prints, writes memory or returns
+EFFECT_OPS = ("call", "print", "store", "alloc", "free", "ret",
+              "speculate", "commit", "guard")
+GUARD_LABEL = "_TRACING_FAILED__"
+
+class Trace:
+    """An acyclic path of blocks, run speculatively from the start of its
+    first block before jumping to end (which may be the first block again,
+    for a loop body).
+
+    Attributes:
+        blocks: block indices along the path.
+        end: the block the path continues to.
+        weight: dynamic instructions executed in blocks, per the profile.
+    """
+    def __init__(self, blocks, end, weight):
+        self.blocks = blocks
+        self.end = end
+        self.weight = weight
+
+def traceable(block) -> bool:
+    return "label" in block[0] and not any(i.get("op") in EFFECT_OPS for i in block)
+
+def select_traces(blocks, graph, block_counts, edge_counts, coverage=0.9,
+                  min_blocks=2, min_ratio=0.5) -> list:
+    """Pick hot acyclic paths through a function from its execution counts.
+
+    Starting from the hottest block not on a trace yet, a path follows the
+    most taken edge out of each block as long as that edge is taken at least
+    min_ratio of the times the block runs, stopping at blocks already on a
+    path, blocks with effects and the first repeat (the loop back edge).
+    Paths become traces (at least min_blocks long) until the blocks on them
+    account for coverage of the function's dynamic instructions.
+
+    Args:
+        blocks, graph: as returned by basic_blocks and cfg.
+        block_counts: list of times each block was entered.
+        edge_counts: dict (from, to) -> times the edge was taken.
+
+    Returns:
+        A list of Traces, hottest first, sharing no blocks (except that one
+        trace may end where another starts).
+    """
+    weight = [n * sum(1 for i in block if "op" in i) for n, block in zip(block_counts, blocks)]
+    goal = coverage * sum(weight)
+    ok = [traceable(block) for block in blocks]
+    on_trace = set()
+    traces = []
+    covered = 0
+    for seed in sorted(range(len(blocks)), key=lambda b: -block_counts[b]):
+        if covered >= goal or block_counts[seed] == 0:
+            break
+        if seed in on_trace or not ok[seed]:
+            continue
+        path = [seed]
+        cut = None  # (length, end) of the longest path so far that can jump to its end
+        b = seed
+        while True:
+            taken = max(graph[b], key=lambda s: edge_counts.get((b, s), 0), default=None)
+            if taken is None or edge_counts.get((b, taken), 0) < max(1, min_ratio * block_counts[b]):
+                break
+            if "label" in blocks[taken][0]:
+                cut = (len(path), taken)
+            if taken in path or taken in on_trace or not ok[taken]:
+                break
+            path.append(taken)
+            b = taken
+        if cut is None or cut[0] < min_blocks:
+            continue
+        length, end = cut
+        trace = Trace(path[:length], end, sum(weight[b] for b in path[:length]))
+        on_trace.update(trace.blocks)
+        traces.append(trace)
+        covered += trace.weight
+    return traces
+
+def fresh_label(base, labels) -> str:
+    label = base
+    while label in labels:
+        label = "_" + label
+    return label
+
+def hot_traces_func(func, profile, coverage=0.9, min_blocks=2, min_ratio=0.5,
+                    optimize=True) -> int:
+    """Insert a speculative trace of every hot path of func, in place.
+
+    Args:
+        profile: the whole-program profile written by interp/brili.py
+            --profile, of this same program.
+        optimize: run each trace through optimize_trace, with what is live
+            at its end label.
+
+    Returns:
+        The number of traces inserted.
+    """
+    counts = profile["functions"].get(func["name"])
+    if counts is None or not func.get("instrs"):
+        return 0
+    blocks, labels = basic_blocks(func["instrs"], quiet=True)
+    if len(counts["blocks"]) != len(blocks):
+        raise ValueError(f"profile of {func['name']} has {len(counts['blocks'])} blocks, "
+                         f"the function has {len(blocks)}")
+    edge_counts = {(u, v): n for u, v, n in counts["edges"]}
+    traces = select_traces(blocks, cfg(blocks, labels), counts["blocks"], edge_counts,
+                           coverage, min_blocks, min_ratio)
+    if not traces:
+        return 0
+    live_in = live_vars(func) if optimize else None
+    taken = set(labels)
+    to_insert = []
+    for i, trace in enumerate(traces):
+        guard = fresh_label(f"{GUARD_LABEL}{i}", taken)
+        taken.add(guard)
+        instrs = [instr for b in trace.blocks for instr in blocks[b]]
+        instrs.append({"label": blocks[trace.end][0]["label"]})
+        start, end, processed = preprocess_trace(instrs, guard)
+        if optimize:
+            processed = optimize_trace(processed, live_in[trace.end])
+        to_insert.append((start, end, processed, guard))
+    func["instrs"] = insert_traces(func["instrs"], to_insert)
+    return len(traces)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Insert speculative traces of the hottest paths of each function")
+    parser.add_argument("profile", help="block and edge counts from interp/brili.py --profile")
+    parser.add_argument("--coverage", type=float, default=0.9,
+                        help="fraction of dynamic instructions the traces should cover")
+    parser.add_argument("--min_blocks", type=int, default=2, help="shortest trace, in blocks")
+    parser.add_argument("--min_ratio", type=float, default=0.5,
+                        help="least fraction of a block's runs its next edge must take")
+    parser.add_argument("--no_optimize", action="store_true",
+                        help="insert the traces as recorded, without optimizing them")
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    with open(args.profile) as f:
+        profile = json.load(f)
+    stream_functions(hot_traces_func, args.jobs, profile, args.coverage, args.min_blocks,
+                     args.min_ratio, not args.no_optimize)
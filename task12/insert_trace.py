@@ -1,15 +1,30 @@
-import sys, json
+import os, sys, json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks
+from task4.live.live import live_vars
+from task12.optimize_trace import optimize_trace
+
+def insert_traces(instrs:list, traces):
+    # traces: (start_label, end_label, trace, guard_label_name) tuples with
+    # distinct start labels, all inserted in one pass over instrs
+    by_start = {t[0]: t for t in traces}
+    out = []
+    for instr in instrs:
+        out.append(instr)
+        if 'label' in instr and instr['label'] in by_start:
+            _, end_label, trace, guard_label_name = by_start[instr['label']]
+            out.append({'op':'speculate'})
+            out.extend(trace)
+            out.extend([
+                {'op':'commit'},
+                {'labels':[end_label],'op':'jmp'},
+                {'label': guard_label_name}
+            ])
+    return out
 
 def insert_trace(instrs:list, start_label, end_label, trace, guard_label_name):
-    insert_pt = instrs.index({'label': start_label}) + 1
-    to_insert = [{'op':'speculate'}] + trace
-    to_insert.extend([
-        {'op':'commit'},
-        {'labels':[end_label],'op':'jmp'},
-        {'label': guard_label_name}
-    ])
-    instrs = instrs[:insert_pt] + to_insert + instrs[insert_pt:]
-    return instrs
+    return insert_traces(instrs, [(start_label, end_label, trace, guard_label_name)])
 
 def preprocess_trace(trace, guard_label_name):
     assert 'label' in trace[0] and 'label' in trace[-1]
@@ -56,20 +71,29 @@ def preprocess_trace(trace, guard_label_name):
     return trace[0]['label'], trace[-1]['label'], processed_trace
 
 
-if __name__ == "__main__":
-    full_bril = json.load(sys.stdin)
-    with open(sys.argv[1]) as f:
+def read_trace(path):
+    with open(path) as f:
         lines = f.readlines()
     assert lines[0][:4] == 'FUNC', lines[0]
     func_name = lines[0][5:].strip()
     trace = [json.loads(l) for l in lines[1:]]
+    return func_name, trace
 
-    guard_label = '_TRACING_FAILED__'
-    for i in range(len(full_bril['functions'])):
-        if full_bril['functions'][i]['name'] == func_name:
-            full_bril['functions'][i]['instrs'] = insert_trace(
-                full_bril['functions'][i]['instrs'],
-                *preprocess_trace(trace, guard_label),
-                guard_label
-            )
+def trace_func(func, func_name, trace, guard_label='_TRACING_FAILED__', optimize=True):
+    if func['name'] == func_name:
+        start_label, end_label, processed_trace = preprocess_trace(trace, guard_label)
+        if optimize:
+            # only what is live where the trace commits to has to be computed
+            _, labels = basic_blocks(func['instrs'], quiet=True)
+            processed_trace = optimize_trace(processed_trace, live_vars(func)[labels[end_label]])
+        func['instrs'] = insert_trace(
+            func['instrs'], start_label, end_label, processed_trace, guard_label
+        )
+
+
+if __name__ == "__main__":
+    full_bril = json.load(sys.stdin)
+    func_name, trace = read_trace(sys.argv[1])
+    for func in full_bril['functions']:
+        trace_func(func, func_name, trace)
     print(json.dumps(full_bril))
@@ -0,0 +1,174 @@
+import os, sys, json
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task3.lvn.lvn import COMMUTATIVE_OPS, UNNUMBERED_OPS, type_key
+from task3.sccp.sccp import FOLD, Const, evaluate, const_value
+
+# ops whose only effect is their dest; div is among them because every
+# division in a trace follows a guard that its divisor is not zero
+PURE_OPS = frozenset(FOLD) | {"const", "id", "ptradd", "load"}
+
+class TraceNumbering:
+    """Value numbers of the variables in a trace, treated as one block.
+
+    Variables from before the trace get a number of their own when first
+    read. holder[n] is a variable holding value n, which may have been
+    overwritten since (then the variable read is used instead).
+    """
+    def __init__(self):
+        self.var = {}  # variable -> value number it holds now
+        self.table = {}  # value key -> value number
+        self.const = {}  # value number -> Const
+        self.holder = []  # value number -> variable that computed it
+
+    def new(self, holder) -> int:
+        self.holder.append(holder)
+        return len(self.holder) - 1
+
+    def number(self, name) -> int:
+        if name not in self.var:
+            self.var[name] = self.new(name)
+        return self.var[name]
+
+    def name(self, arg) -> str:
+        """The variable to read the value of arg from."""
+        return self.holds(self.number(arg)) or arg
+
+    def holds(self, n):
+        """A variable holding value n now, or None."""
+        holder = self.holder[n]
+        return holder if self.var.get(holder) == n else None
+
+    def define(self, dest, key=None) -> int:
+        """Number dest as computing the value key (a new value if None)."""
+        n = self.table.get(key) if key is not None else None
+        if n is None:
+            n = self.new(dest)
+            if key is not None:
+                self.table[key] = n
+        elif self.holds(n) is None:
+            self.holder[n] = dest
+        self.var[dest] = n
+        return n
+
+def number_trace(trace) -> list:
+    """Value numbering with constant folding over a straight-line trace.
+
+    Recomputed values become ids of the variable holding them, constant
+    results become consts, and guards on a value already guarded (or known
+    true) are dropped: a guard that fails rolls the whole trace back, so
+    after it its condition can be taken as true.
+    """
+    vn = TraceNumbering()
+    guarded = set()
+    out = []
+    for instr in trace:
+        op = instr.get("op")
+        if op == "nop":
+            continue
+        args = [vn.name(a) for a in instr.get("args", [])]
+        if op == "guard":
+            n = vn.number(instr["args"][0])
+            if n in guarded or vn.const.get(n) == Const(True):
+                continue
+            guarded.add(n)
+            vn.const[n] = Const(True)
+            out.append({**instr, "args": args})
+            continue
+        if "dest" not in instr:
+            out.append({**instr, "args": args} if args else instr)
+            continue
+        dest = instr["dest"]
+        nums = [vn.number(a) for a in instr.get("args", [])]
+        value = None
+        if op == "const":
+            value = const_value(instr)
+        elif op == "id" and nums[0] in vn.const:
+            value = vn.const[nums[0]]
+        elif op in FOLD and all(n in vn.const for n in nums):
+            value = evaluate(op, [vn.const[n].value for n in nums])
+            value = value if isinstance(value, Const) else None
+        if value is not None:
+            n = vn.define(dest, ("const", type_key(instr["type"]), value))
+            vn.const[n] = value
+            out.append({"op": "const", "dest": dest, "type": instr["type"], "value": value.value})
+            continue
+        if op == "id":
+            vn.var[dest] = nums[0]
+            out.append({**instr, "args": args})
+            continue
+        if op in UNNUMBERED_OPS or op not in PURE_OPS:
+            vn.define(dest)
+            out.append({**instr, "args": args} if args else instr)
+            continue
+        if op in COMMUTATIVE_OPS:
+            nums = sorted(nums)
+        key = (op, type_key(instr["type"]), tuple(nums))
+        known = vn.table.get(key)
+        source = vn.holds(known) if known is not None else None
+        if source is not None:
+            vn.var[dest] = known
+            if source != dest:
+                out.append({"op": "id", "dest": dest, "type": instr["type"], "args": [source]})
+            continue
+        vn.define(dest, key)
+        out.append({**instr, "args": args})
+    return out
+
+def hoist_guards(trace) -> list:
+    """Move each guard up to just after the definition of its condition
+    (to the top of the trace if it was defined before), so a failing trace
+    gives up as early as it can. Guards meeting at one point keep their
+    order.
+    """
+    out = []
+    last_def = {}  # variable -> index in out of its latest definition
+    for instr in trace:
+        if instr.get("op") == "guard":
+            at = last_def.get(instr["args"][0], -1) + 1
+            # stay behind guards already placed there
+            while at < len(out) and out[at].get("op") == "guard":
+                at += 1
+            out.insert(at, instr)
+            for var, i in last_def.items():
+                if i >= at:
+                    last_def[var] = i + 1
+            continue
+        if "dest" in instr:
+            last_def[instr["dest"]] = len(out)
+        out.append(instr)
+    return out
+
+def eliminate_dead(trace, live_out) -> list:
+    """Drop pure instructions whose dest is not read later in the trace or
+    live after it commits."""
+    live = set(live_out)
+    out = []
+    for instr in reversed(trace):
+        if "dest" in instr:
+            if instr.get("op") in PURE_OPS and instr["dest"] not in live:
+                continue
+            live.discard(instr["dest"])
+        live.update(instr.get("args", ()))
+        out.append(instr)
+    out.reverse()
+    return out
+
+def optimize_trace(trace, live_out) -> list:
+    """Optimize the instructions between speculate and commit.
+
+    Args:
+        trace: the straight-line trace, as returned by preprocess_trace.
+        live_out: variables live at the label the trace jumps to on commit.
+            Nothing else can see the trace's values: a failed guard rolls
+            them all back.
+    """
+    return eliminate_dead(hoist_guards(number_trace(trace)), live_out)
+
+if __name__ == "__main__":
+    # a program whose functions are straight-line traces (as returned by
+    # preprocess_trace) on stdin, live-out variables as arguments
+    program = json.load(sys.stdin)
+    for func in program["functions"]:
+        for instr in optimize_trace(func["instrs"], sys.argv[1:]):
+            print(json.dumps(instr, sort_keys=True))
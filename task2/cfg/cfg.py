@@ -1,6 +1,9 @@
-import sys
+import sys, os
 import json
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from task2.cfg.traversal import DepthFirstSearch
+
 def basic_blocks(instrs, quiet=False):
     blocks = [[]]
     labels = {}
@@ -21,16 +24,8 @@ def basic_blocks(instrs, quiet=False):
     return [b for b in blocks if len(b) > 0], labels
 
 def reachable_cfg(cfg, entry):
-    visited = set()
-    def visit(node):
-        if node in visited:
-            return
-        visited.add(node)
-        for succ in cfg[node]:
-            visit(succ)
-
-    visit(entry)
-    return {n: cfg[n] for n in visited}
+    visited = DepthFirstSearch(cfg, entry).pre
+    return {n: succs for n, succs in cfg.items() if n in visited}
 
 def cfg(blocks, labels):
     graph = {}
@@ -0,0 +1,74 @@
+class DepthFirstSearch:
+    """One depth-first walk of a graph from an entry node.
+
+    The walk uses an explicit stack, so it works on graphs of any depth
+    without hitting Python's recursion limit, and visits successors in the
+    same order a recursive DFS would. Nodes are numbered in preorder and
+    postorder as they are entered and left.
+
+    Attributes:
+        preorder: nodes in the order they were first entered.
+        postorder: nodes in the order they were finished.
+        pre: dict mapping each reachable node to its preorder number.
+        post: dict mapping each reachable node to its postorder number.
+    """
+    def __init__(self, graph, entry):
+        self.preorder = []
+        self.postorder = []
+        self.pre = {}
+        self.post = {}
+        pre, post = self.pre, self.post
+        pre[entry] = 0
+        self.preorder.append(entry)
+        stack = [(entry, iter(graph[entry]))]
+        while stack:
+            node, succs = stack[-1]
+            for succ in succs:
+                if succ not in pre:
+                    pre[succ] = len(self.preorder)
+                    self.preorder.append(succ)
+                    stack.append((succ, iter(graph[succ])))
+                    break
+            else:
+                stack.pop()
+                post[node] = len(self.postorder)
+                self.postorder.append(node)
+
+    @property
+    def rpo(self) -> list:
+        """Nodes in reverse postorder."""
+        return self.postorder[::-1]
+
+    def reachable(self, node) -> bool:
+        return node in self.pre
+
+def walk(tree, root):
+    """Walk a tree (e.g. a dominator tree) depth-first without recursion.
+
+    Yields (node, True) when a node is entered, before any of its children,
+    and (node, False) when it is left, after all of them, so callers can
+    undo per-node state the way a recursive walk would on return.
+    """
+    stack = [(root, False), (root, True)]
+    while stack:
+        node, entering = stack.pop()
+        yield node, entering
+        if entering:
+            for child in reversed(tree.get(node, [])):
+                stack.append((child, False))
+                stack.append((child, True))
+
+def reachable_from(graph, roots, blocked=()) -> set:
+    """Nodes reachable from any of roots without passing through blocked.
+
+    Roots are always included; other blocked nodes are never entered.
+    """
+    visited = set(roots)
+    stack = list(visited)
+    while stack:
+        node = stack.pop()
+        for succ in graph[node]:
+            if succ not in visited and succ not in blocked:
+                visited.add(succ)
+                stack.append(succ)
+    return visited
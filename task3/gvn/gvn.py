@@ -0,0 +1,146 @@
+import sys, os
+import json
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from task2.cfg.traversal import walk
+from task3.lvn.lvn import COMMUTATIVE_OPS, type_key
+from driver.analysis import FunctionAnalyses
+from driver.stream import stream_functions
+
+# ops whose result only depends on their arguments, so a dominating
+# computation of the same value can be reused
+VALUE_OPS = ("const", "add", "sub", "mul", "div", "eq", "lt", "gt", "le", "ge",
+             "not", "and", "or", "fadd", "fsub", "fmul", "fdiv",
+             "feq", "flt", "fgt", "fle", "fge", "ptradd")
+
+def redundant_gets(blocks, dominators, arg_names=()):
+    """Find gets that receive the same value along every incoming edge.
+
+    A get whose sets all pass the same value v (or the get's own value, around
+    a loop) is just a copy of v, as long as v's definition dominates the get.
+    Resolving one get can make others redundant, so this iterates until no
+    more are found.
+
+    Returns:
+        A dict mapping each redundant get's dest to the variable it copies.
+    """
+    def_block = {a: 0 for a in arg_names}  # arguments are defined on entry
+    get_block = {}
+    incoming = {}  # get dest -> values passed to it by its sets
+    for b, block in enumerate(blocks):
+        for instr in block:
+            if instr.get("op") == "set":
+                incoming.setdefault(instr["args"][0], []).append(instr["args"][1])
+            elif "dest" in instr:
+                def_block[instr["dest"]] = b
+                if instr["op"] == "get":
+                    get_block[instr["dest"]] = b
+
+    copies = {}
+    def resolve(v):
+        while v in copies:
+            v = copies[v]
+        return v
+
+    changed = True
+    while changed:
+        changed = False
+        for g, b in get_block.items():
+            if g in copies or g not in incoming or b not in dominators:
+                continue
+            values = {resolve(v) for v in incoming[g]} - {g}
+            if len(values) != 1:
+                continue
+            v = values.pop()
+            if v in def_block and def_block[v] in dominators[b]:
+                copies[g] = v
+                changed = True
+    return {g: resolve(v) for g, v in copies.items()}
+
+def gvn_func(func, am=None) -> None:
+    """Global value numbering on a function in SSA form, in place.
+
+    Walks the dominator tree with a scoped table from canonical values to the
+    variable that first computed them, so an expression is reused in every
+    block its first computation dominates. Copies (ids and redundant gets)
+    are propagated and the sets feeding redundant gets are dropped.
+
+    Args:
+        func: a function in SSA form, as produced by task6/toSSA.py.
+        am: optionally, the FunctionAnalyses of func. Everything in it is
+            invalidated on return.
+    """
+    if am is None:
+        am = FunctionAnalyses(func)
+    blocks, _ = am.get("blocks")
+    dom_tree = am.get("dom_tree")
+    arg_names = [a["name"] for a in func.get("args", [])]
+    copies = redundant_gets(blocks, am.get("dominators"), arg_names)
+
+    # SSA names are defined once and every use is dominated by the
+    # definition, so the variable-to-leader map does not need scoping
+    leader = {}
+    def lookup(v):
+        return leader.get(v, v)
+
+    table = {}
+    removed = set()  # ids of instructions made redundant
+    added = {}  # block -> keys it added to table, removed on leaving it
+    for b, entering in walk(dom_tree, 0):
+        if not entering:
+            for key in added.pop(b):
+                del table[key]
+            continue
+        added[b] = []
+        for instr in blocks[b]:
+            op = instr.get("op")
+            if op == "get" and instr["dest"] in copies:
+                leader[instr["dest"]] = lookup(copies[instr["dest"]])
+                removed.add(id(instr))
+            elif op == "set" and instr["args"][0] in copies:
+                removed.add(id(instr))
+            elif op == "id":
+                leader[instr["dest"]] = lookup(instr["args"][0])
+                removed.add(id(instr))
+            elif op in VALUE_OPS and "dest" in instr:
+                if op == "const":
+                    # 0.0 and -0.0 (or 1 and 1.0) compare equal but aren't the same constant
+                    key = (op, type_key(instr["type"]), json.dumps(instr["value"]))
+                else:
+                    args = [lookup(a) for a in instr["args"]]
+                    if op in COMMUTATIVE_OPS:
+                        args.sort()
+                    key = (op, type_key(instr["type"]), tuple(args))
+                if key in table:
+                    leader[instr["dest"]] = table[key]
+                    removed.add(id(instr))
+                else:
+                    table[key] = instr["dest"]
+                    added[b].append(key)
+
+    new_instrs = []
+    for block in blocks:
+        for instr in block:
+            if id(instr) in removed:
+                continue
+            if "args" in instr:
+                if instr.get("op") == "set":
+                    # the first argument names a get, not a value
+                    instr["args"] = [instr["args"][0]] + [lookup(a) for a in instr["args"][1:]]
+                else:
+                    instr["args"] = [lookup(a) for a in instr["args"]]
+            new_instrs.append(instr)
+    func["instrs"] = new_instrs
+    am.invalidate()
+
+def gvn(full_bril):
+    for func in full_bril["functions"]:
+        gvn_func(func)
+    return full_bril
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    stream_functions(gvn_func, args.jobs)
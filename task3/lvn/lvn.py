@@ -1,121 +1,129 @@
 import sys, os
 import json
 import argparse
+from array import array
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from task2.cfg.cfg import basic_blocks
+from driver.ir import from_bril, to_bril, blocks, OPCODE_NUMS, CONST, ID, LABEL, NO_VAR
+from driver.stream import stream_functions
 
 NO_VALUE_OPS = ("jmp", "nop")
 COMMUTATIVE_OPS = ("add", "mul", "eq", "and", "or")
+# ops with a dest whose result is not determined by their arguments alone
+UNNUMBERED_OPS = ("call", "get", "undef", "alloc", "load")
+LITERAL = "_literal"
 
-def lvn_block(block, semantics = True):
-    emitted_instrs = []
-    values = []
-    new_names = []
+# the same, as interned opcodes of driver.ir
+NO_VALUE = frozenset(OPCODE_NUMS[op] for op in NO_VALUE_OPS) | {LABEL}
+COMMUTATIVE = frozenset(OPCODE_NUMS[op] for op in COMMUTATIVE_OPS)
+UNNUMBERED = frozenset(OPCODE_NUMS[op] for op in UNNUMBERED_OPS)
+
+def type_key(t):
+    # parameterized types like {"ptr": "int"} are dicts, which can't be hashed
+    return t if isinstance(t, str) else json.dumps(t, sort_keys=True)
+
+def lvn_block(block, names, semantics = True):
+    """Value-number one basic block of a driver.ir.Function in place.
+
+    Every instruction stays where it is: recomputed values become ids of
+    the variable holding them, and variables assigned again later in the
+    block get a fresh name (interned in names) so their values stay
+    reachable.
+    """
+    values = []  # value number -> canonical value tuple
+    table = {}  # canonical value tuple -> first value number computing it
+    new_names = []  # value number -> canonical variable holding it
     map_from_orig_names = {}
 
     definitions_left = {}
 
     for inst in block:
         # initialize values with variables defined in previous blocks
-        if "args" in inst:
-            for a in inst["args"]:
+        if inst.args:
+            for a in inst.args:
                 # insert in table as literal if not already there
                 if a not in map_from_orig_names:
-                    values.append({"op": "_literal", "name": a})
+                    values.append((LITERAL, a))
                     new_names.append(a)
                     map_from_orig_names[a] = len(values) - 1
         # initialize definitions_left with how many times each variable is (re)defined in this block
-        if "dest" in inst:
-            if inst["dest"] in definitions_left:
-                definitions_left[inst["dest"]] += 1
-            else:
-                definitions_left[inst["dest"]] = 1
+        if inst.dest != NO_VAR:
+            definitions_left[inst.dest] = definitions_left.get(inst.dest, 0) + 1
+
+    def rename_dest(dest):
+        definitions_left[dest] -= 1
+        if definitions_left[dest] > 0:
+            return names.num(f"{names.names[dest]}_{definitions_left[dest]}")
+        return dest
 
     for inst in block:
-        if ("label" in inst or inst["op"] in NO_VALUE_OPS):
+        op = inst.op
+        if op in NO_VALUE:
             # does not handle values at all
-            emitted_instrs.append(inst)
-        elif "dest" in inst: # computes a value
-            value = {}
-            if inst["op"] == "const":
-                value = {"op": inst["op"], "type": inst["type"], "value": inst["value"]}
+            continue
+        args = inst.args
+        if inst.dest != NO_VAR: # computes a value
+            dest = inst.dest
+            if op == CONST:
+                value = (op, type_key(inst.type), inst.value)
             else:
-                arg_nums = [map_from_orig_names[a] for a in inst["args"]]
-                if semantics and inst["op"] in COMMUTATIVE_OPS:
-                    arg_nums = sorted(arg_nums)
-                value = {"op": inst["op"],
-                         "type": inst["type"],
-                         "args": arg_nums}
+                arg_nums = [map_from_orig_names[a] for a in args] if args else []
+                if semantics and op in COMMUTATIVE:
+                    arg_nums.sort()
+                value = (op, type_key(inst.type), tuple(arg_nums))
             # whether this is an extraneous id we should bypass
             # DO NOT BYPASS IDS OF LITERALS; we may lose copies since we don't rename literals
             # (deleting ids of literals broke core/euclid)
-            remap_id = (semantics 
-                        and inst["op"] == "id" 
-                        and values[map_from_orig_names[inst["args"][0]]]["op"] != "_literal")
+            remap_id = (semantics
+                        and op == ID
+                        and values[map_from_orig_names[args[0]]][0] != LITERAL)
             # check to see if value already computed, if so:
-            if inst["op"] != "call" and (remap_id or value in values):
-                # update table and emit id (will be dead code unless used in future block)
+            if op not in UNNUMBERED and (remap_id or value in table):
+                # update table and turn into an id (dead code unless used in a future block)
                 if remap_id:
-                    map_from_orig_names[inst["dest"]] = map_from_orig_names[inst["args"][0]]
+                    map_from_orig_names[dest] = map_from_orig_names[args[0]]
                 else:
-                    map_from_orig_names[inst["dest"]] = values.index(value)
-                
-                definitions_left[inst["dest"]] -= 1
-                suffix = ""
-                if definitions_left[inst["dest"]] > 0:
-                    suffix = "_" + str(definitions_left[inst["dest"]])
-                new_name = inst["dest"] + suffix
-
-                emitted_instrs.append(
-                    {"op": "id",
-                     "type": inst["type"],
-                     "dest": new_name,
-                     "args": [new_names[map_from_orig_names[inst["dest"]]]]
-                     })
-            # else:
+                    map_from_orig_names[dest] = table[value]
+                inst.op = ID
+                inst.dest = rename_dest(dest)
+                inst.args = array("i", [new_names[map_from_orig_names[dest]]])
+                inst.funcs = inst.labels = inst.value = None
             else:
                 # RENAME HERE
-                definitions_left[inst["dest"]] -= 1
-                suffix = ""
-                if definitions_left[inst["dest"]] > 0:
-                    suffix = "_" + str(definitions_left[inst["dest"]])
-                new_name = inst["dest"] + suffix
-                # add value to table, update mapping, emit renamed instr
+                if args:
+                    for i, a in enumerate(args):
+                        args[i] = new_names[map_from_orig_names[a]]
+                inst.dest = rename_dest(dest)
+                # add value to table, update mapping
+                table.setdefault(value, len(values))  # calls can repeat; keep the first
                 values.append(value)
-                new_names.append(new_name)
-
-                new_inst = inst.copy()
-                new_inst["dest"] = new_name
-                if "args" in inst:
-                    renamed_args = [new_names[map_from_orig_names[a]] for a in inst["args"]]
-                    new_inst["args"] = renamed_args
-                emitted_instrs.append(new_inst)
+                new_names.append(inst.dest)
 
                 # have to update map down here so it doesn't get captured in renamed args
-                map_from_orig_names[inst["dest"]] = len(values)-1
-        else:
-            # emit with renamed
-            new_inst = inst.copy()
-            if "args" in inst:
-                    renamed_args = [new_names[map_from_orig_names[a]] for a in inst["args"]]
-                    new_inst["args"] = renamed_args
-            emitted_instrs.append(new_inst)
-    return emitted_instrs
+                map_from_orig_names[dest] = len(values)-1
+        elif args:
+            # rename the args
+            for i, a in enumerate(args):
+                args[i] = new_names[map_from_orig_names[a]]
+
+def lvn_ir(func, semantics=True):
+    """Run LVN on every block of a function in the internal IR."""
+    for b in blocks(func.instrs):
+        lvn_block(b, func.names, semantics)
+
+def lvn_func(func, semantics=True):
+    ir_func = from_bril(func)
+    lvn_ir(ir_func, semantics)
+    func["instrs"] = to_bril(ir_func)["instrs"]
 
 def lvn(full_bril, semantics=True):
     for f in full_bril["functions"]:
-        blocks, _ = basic_blocks(f["instrs"], quiet=True)
-        new_instrs = []
-        for b in blocks:
-            new_instrs.extend(lvn_block(b, semantics))
-        f["instrs"] = new_instrs
+        lvn_func(f, semantics)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--no_semantics", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1)
     args = parser.parse_args()
-    full_bril = json.load(sys.stdin)
-    lvn(full_bril, not args.no_semantics)
-    print(json.dumps(full_bril, indent=2))
+    stream_functions(lvn_func, args.jobs, not args.no_semantics)
 
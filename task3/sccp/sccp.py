@@ -0,0 +1,278 @@
+import sys, os
+import math
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
+from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
+from task4.worklist import flip_cfg
+from driver.analysis import FunctionAnalyses
+from driver.stream import stream_functions
+
+# lattice values: TOP (no executed definition seen yet), a constant, or
+# BOTTOM (may take more than one value at run time)
+TOP = "TOP"
+BOTTOM = "BOTTOM"
+
+class Const:
+    """A known constant. int, bool and float values are kept apart (True == 1
+    in Python, but not in Bril)."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return (isinstance(other, Const) and type(self.value) is type(other.value)
+                and repr(self.value) == repr(other.value))
+
+    def __hash__(self):
+        return hash(repr(self.value))
+
+    def __repr__(self):
+        return f"Const({self.value!r})"
+
+def wrap(n) -> int:
+    """Wrap an int to 64-bit two's complement, like brili."""
+    return (n + 2**63) % 2**64 - 2**63
+
+def int_div(a, b) -> int:
+    # truncates towards zero, unlike //
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+FOLD = {
+    "add": lambda a, b: wrap(a + b),
+    "sub": lambda a, b: wrap(a - b),
+    "mul": lambda a, b: wrap(a * b),
+    "div": lambda a, b: wrap(int_div(a, b)),
+    "eq": lambda a, b: a == b,
+    "lt": lambda a, b: a < b,
+    "gt": lambda a, b: a > b,
+    "le": lambda a, b: a <= b,
+    "ge": lambda a, b: a >= b,
+    "not": lambda a: not a,
+    "and": lambda a, b: a and b,
+    "or": lambda a, b: a or b,
+    "fadd": lambda a, b: a + b,
+    "fsub": lambda a, b: a - b,
+    "fmul": lambda a, b: a * b,
+    "fdiv": lambda a, b: a / b,
+    "feq": lambda a, b: a == b,
+    "flt": lambda a, b: a < b,
+    "fgt": lambda a, b: a > b,
+    "fle": lambda a, b: a <= b,
+    "fge": lambda a, b: a >= b,
+}
+
+def evaluate(op, args):
+    """Fold op over constant argument values; BOTTOM if it can't be folded
+    (division by zero is left for run time, as are non-finite floats)."""
+    try:
+        result = FOLD[op](*args)
+    except (ZeroDivisionError, OverflowError):
+        return BOTTOM
+    if isinstance(result, float) and not math.isfinite(result):
+        return BOTTOM
+    return Const(result)
+
+def meet(a, b):
+    if a == TOP:
+        return b
+    if b == TOP or a == b:
+        return a
+    return BOTTOM
+
+def const_value(instr):
+    value = instr["value"]
+    if instr["type"] == "float":
+        return Const(float(value))
+    if instr["type"] == "bool":
+        return Const(bool(value))
+    return Const(value)
+
+class SCCP:
+    """Sparse conditional constant propagation over one SSA function.
+
+    Tracks a lattice value for every SSA name and whether each CFG edge can
+    execute. Instructions are only evaluated once their block is known to
+    execute, and a get only meets the values set along executable edges.
+    """
+    def __init__(self, func, blocks, labels, graph):
+        self.blocks = blocks
+        self.labels = labels
+        self.graph = graph
+        self.preds = flip_cfg(graph)
+        self.value = {a["name"]: BOTTOM for a in func.get("args", [])}
+        self.executable = set()
+        self.edges = set()
+        self.uses = {}  # var -> [(block, instr index)] of instructions using it
+        self.set_args = {}  # (block, shadow) -> var set there
+        self.set_uses = {}  # var -> [(block, shadow)] of sets passing it on
+        self.gets = {}  # shadow -> (block, instr index) of its get
+        for b, block in enumerate(blocks):
+            for i, instr in enumerate(block):
+                op = instr.get("op")
+                if op == "set":
+                    shadow, arg = instr["args"]
+                    self.set_args[(b, shadow)] = arg
+                    self.set_uses.setdefault(arg, []).append((b, shadow))
+                    continue
+                for a in instr.get("args", []):
+                    self.uses.setdefault(a, []).append((b, i))
+                if op == "get":
+                    self.gets[instr["dest"]] = (b, i)
+        # variables nothing defines can hold anything
+        defined = {instr["dest"] for block in blocks for instr in block if "dest" in instr}
+        for var in list(self.uses) + list(self.set_uses):
+            if var not in defined:
+                self.value.setdefault(var, BOTTOM)
+        self.flow_work = [(None, 0)]
+        self.ssa_work = []
+
+    def get(self, var):
+        return self.value.get(var, TOP)
+
+    def update(self, var, new):
+        old = self.get(var)
+        new = meet(old, new)
+        if new != old:
+            self.value[var] = new
+            self.ssa_work.append(var)
+
+    def get_value(self, b, shadow):
+        # meet of what is set along every executable edge into b
+        result = TOP
+        for p in self.preds[b]:
+            if (p, b) in self.edges:
+                arg = self.set_args.get((p, shadow))
+                result = meet(result, self.get(arg) if arg is not None else BOTTOM)
+        return result
+
+    def visit(self, b, i):
+        instr = self.blocks[b][i]
+        op = instr.get("op")
+        if op is None or op == "set":
+            return
+        if op == "br":
+            cond = self.get(instr["args"][0])
+            if cond == BOTTOM:
+                targets = instr["labels"]
+            elif cond == TOP:
+                targets = []
+            else:
+                targets = [instr["labels"][0 if cond.value else 1]]
+            for l in targets:
+                self.flow_work.append((b, self.labels[l]))
+            return
+        if op == "jmp":
+            self.flow_work.append((b, self.labels[instr["labels"][0]]))
+            return
+        if "dest" not in instr:
+            return
+        if op == "const":
+            new = const_value(instr)
+        elif op == "get":
+            new = self.get_value(b, instr["dest"])
+        elif op == "id":
+            new = self.get(instr["args"][0])
+        elif op in FOLD:
+            args = [self.get(a) for a in instr["args"]]
+            if BOTTOM in args:
+                new = BOTTOM
+            elif TOP in args:
+                new = TOP
+            else:
+                new = evaluate(op, [a.value for a in args])
+        else:
+            new = BOTTOM  # calls, loads, undef, ...
+        self.update(instr["dest"], new)
+
+    def run(self):
+        while self.flow_work or self.ssa_work:
+            while self.flow_work:
+                p, b = self.flow_work.pop()
+                if (p, b) in self.edges:
+                    continue
+                self.edges.add((p, b))
+                if b not in self.executable:
+                    self.executable.add(b)
+                    block = self.blocks[b]
+                    for i in range(len(block)):
+                        self.visit(b, i)
+                    if block[-1].get("op") not in ("br", "jmp", "ret"):
+                        for s in self.graph[b]:  # falls through
+                            self.flow_work.append((b, s))
+                else:
+                    # a new way in: only the gets can change
+                    for i, instr in enumerate(self.blocks[b]):
+                        if instr.get("op") == "get":
+                            self.visit(b, i)
+            while self.ssa_work:
+                var = self.ssa_work.pop()
+                for b, i in self.uses.get(var, ()):
+                    if b in self.executable:
+                        self.visit(b, i)
+                for p, shadow in self.set_uses.get(var, ()):
+                    if shadow in self.gets:
+                        b, i = self.gets[shadow]
+                        if (p, b) in self.edges:
+                            self.visit(b, i)
+
+def sccp_func(func, am=None) -> None:
+    """Sparse conditional constant propagation on a function in SSA form.
+
+    Names with a constant value become consts (gets too, dropping their
+    sets), branches on constant conditions become jumps, and blocks that
+    are no longer reachable are removed.
+
+    Args:
+        func: a function in SSA form, as produced by task6/toSSA.py.
+        am: optionally, the FunctionAnalyses of func. Everything in it is
+            invalidated on return.
+    """
+    if am is None:
+        am = FunctionAnalyses(func)
+    if not func["instrs"]:
+        return
+    blocks, labels = am.get("blocks")
+    sccp = SCCP(func, blocks, labels, am.get("cfg"))
+    sccp.run()
+
+    folded_gets = set()
+    for b in sccp.executable:
+        block = blocks[b]
+        for i, instr in enumerate(block):
+            op = instr.get("op")
+            if op == "br":
+                cond = sccp.get(instr["args"][0])
+                if isinstance(cond, Const):
+                    block[i] = {"op": "jmp", "labels": [instr["labels"][0 if cond.value else 1]]}
+            elif (op == "get" or op == "id" or op in FOLD) and "dest" in instr:
+                value = sccp.get(instr["dest"])
+                if isinstance(value, Const):
+                    block[i] = {"op": "const", "dest": instr["dest"],
+                                "type": instr["type"], "value": value.value}
+                    if op == "get":
+                        folded_gets.add(instr["dest"])
+
+    # drop blocks that can no longer be reached
+    instrs = [instr for block in blocks for instr in block]
+    blocks, labels = basic_blocks(instrs, quiet=True)
+    reachable = reachable_cfg(cfg(blocks, labels), 0)
+    instrs = [instr for b, block in enumerate(blocks) if b in reachable for instr in block]
+    gets = {instr["dest"] for instr in instrs if instr.get("op") == "get"}
+    func["instrs"] = [instr for instr in instrs
+                      if instr.get("op") != "set"
+                      or (instr["args"][0] in gets and instr["args"][0] not in folded_gets)]
+    am.invalidate()
+
+def sccp(full_bril):
+    for func in full_bril["functions"]:
+        sccp_func(func)
+    return full_bril
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    stream_functions(sccp_func, args.jobs)
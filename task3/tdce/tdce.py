@@ -1,56 +1,111 @@
 import sys, os
 import json
+import argparse
+from array import array
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
-from task2.cfg.cfg import basic_blocks 
-
-def globally_unused_vars(func):
-    """Remove all variables that are defined but never used."""
-    used = set()
-    for instr in func["instrs"]:
-        if "args" in instr and instr["args"]:
-            used.update(instr["args"])
-    
-    filtered_instrs = []
-    for instr in func["instrs"]:
-        if "dest" in instr and instr["dest"] not in used:
-            continue
-        filtered_instrs.append(instr)
-    func["instrs"] = filtered_instrs
-
-def iterate(func):
-    """Iteratively apply optimizations until no changes occur."""
-    while True:
-        before = len(func["instrs"])
-        globally_unused_vars(func)
-        after = len(func["instrs"])
-        if before == after:
-            break
-
-def locally_killed_instrs(func):
-    """Remove instructions that are reassigned before they are used within the same block."""
-    blocks, _ = basic_blocks(func["instrs"], quiet=True)
-    for block in blocks:
-        assigned = {}
-        for instr in reversed(block):
-            if "args" in instr and instr["args"]:
-                for arg in instr["args"]:
-                    assigned[arg] = False
-            elif "dest" in instr:
-                if instr["dest"] in assigned and assigned[instr["dest"]]:
-                    block.remove(instr)
-                else:
-                    assigned[instr["dest"]] = True
-            
-    func["instrs"] = [instr for block in blocks for instr in block]
-    
+from driver.ir import from_bril, to_bril, OPCODE_NUMS, BR, JMP, LABEL, NO_VAR
+from driver.stream import stream_functions
+
+# ops that only compute their dest, so they can go once it is never used;
+# anything else with a dest (calls, unknown extensions) is always kept
+REMOVABLE_OPS = frozenset(OPCODE_NUMS[op] for op in (
+    "const", "id", "add", "sub", "mul", "div",
+    "eq", "lt", "gt", "le", "ge", "not", "and", "or",
+    "fadd", "fsub", "fmul", "fdiv", "feq", "flt", "fgt", "fle", "fge",
+    "alloc", "load", "ptradd", "get", "undef",
+))
+
+class DeadCode:
+    """Use counts and definition sites of every variable in a function.
+
+    Both are built once; deleting an instruction decrements the use counts
+    of its arguments, and definitions of variables whose count drops to zero
+    are queued for deletion in turn, so each instruction is looked at a
+    constant number of times however long the chains of dead code are.
+    """
+    def __init__(self, func):
+        self.func = func
+        self.uses = array("i", bytes(4 * len(func.names)))
+        self.defs = [[] for _ in range(len(func.names))]
+        self.dead = bytearray(len(func.instrs))
+        self.worklist = []
+        for i, instr in enumerate(func.instrs):
+            if instr.args:
+                for a in instr.args:
+                    self.uses[a] += 1
+            if instr.dest != NO_VAR and instr.op in REMOVABLE_OPS:
+                self.defs[instr.dest].append(i)
+        for v, count in enumerate(self.uses):
+            if count == 0:
+                self.worklist.extend(self.defs[v])
+
+    def delete(self, i):
+        instrs, uses, defs = self.func.instrs, self.uses, self.defs
+        self.dead[i] = 1
+        if instrs[i].args:
+            for a in instrs[i].args:
+                uses[a] -= 1
+                if uses[a] == 0:
+                    self.worklist.extend(defs[a])
+
+    def globally_unused_vars(self):
+        """Remove all instructions whose dest is never used anywhere."""
+        while self.worklist:
+            i = self.worklist.pop()
+            if not self.dead[i]:
+                self.delete(i)
+
+    def locally_killed_instrs(self):
+        """Remove instructions that are reassigned before they are used within the same block.
+
+        One backward pass per block: an instruction is dead if its dest is
+        assigned again later in the block with no use in between.
+        """
+        instrs, dead = self.func.instrs, self.dead
+        killed = {}  # var -> assigned later in the block and not used since
+        for i in range(len(instrs) - 1, -1, -1):
+            instr = instrs[i]
+            if instr.op == BR or instr.op == JMP:
+                killed.clear()  # end of a block
+            if dead[i]:
+                continue
+            if instr.dest != NO_VAR:
+                if killed.get(instr.dest) and instr.op in REMOVABLE_OPS:
+                    self.delete(i)
+                    continue
+                killed[instr.dest] = True
+            if instr.args:
+                for a in instr.args:
+                    killed[a] = False
+            if instr.op == LABEL:
+                killed.clear()  # start of a block
+
+    def remove(self):
+        self.func.instrs = [instr for i, instr in enumerate(self.func.instrs)
+                            if not self.dead[i]]
+
+def dce_ir(func):
+    """Run both eliminations on a function in the internal IR."""
+    dce = DeadCode(func)
+    dce.globally_unused_vars()
+    dce.locally_killed_instrs()
+    # locally killed instructions may have been the last uses of others
+    dce.globally_unused_vars()
+    dce.remove()
+
+def dce_func(func):
+    ir_func = from_bril(func)
+    dce_ir(ir_func)
+    func["instrs"] = to_bril(ir_func)["instrs"]
+
 def dce(full_bril):
     for func in full_bril["functions"]:
-        iterate(func)
-        locally_killed_instrs(func)
+        dce_func(func)
     return full_bril
 
 if __name__ == "__main__":
-    full_bril = json.load(sys.stdin)
-    optimized_bril = dce(full_bril)
-    print(json.dumps(optimized_bril, indent=2))
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    stream_functions(dce_func, args.jobs)
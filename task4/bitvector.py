@@ -0,0 +1,59 @@
+import os, sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../'))
+from task4.worklist import worklist
+
+class Numbering:
+    '''
+    Assigns consecutive bit positions to hashable items (variable names,
+    definition sites, ...) so sets of them can be stored as Python ints.
+    '''
+    def __init__(self):
+        self.index = {}
+        self.items = []
+
+    def bit(self, item) -> int:
+        '''Return the single-bit mask of item, numbering it if it is new.'''
+        i = self.index.get(item)
+        if i is None:
+            i = self.index[item] = len(self.items)
+            self.items.append(item)
+        return 1 << i
+
+    def to_list(self, bits) -> list:
+        '''Decode a bitset into the items it contains, in numbering order.'''
+        result = []
+        items = self.items
+        while bits:
+            low = bits & -bits
+            result.append(items[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+    def to_set(self, bits) -> set:
+        '''Decode a bitset back into the set of items it contains.'''
+        return set(self.to_list(bits))
+
+def bitvector_worklist(blocks, cfg, gen, kill, backward=False, stats=None) -> tuple:
+    '''
+    Solve a "may" dataflow problem (union meet) over bitsets.
+    blocks: list of blocks
+    cfg: control flow graph as a dict mapping block to list of successor blocks,
+         in the direction of the analysis (flip it for backward problems)
+    gen, kill: lists of int bitsets, one per block, computed once up front
+    backward, stats: passed through to worklist
+    Every block's transfer function is out = gen | (in & ~kill), so union,
+    kill and the convergence check are each a single int operation.
+    '''
+    not_kill = [~k for k in kill]
+
+    def transfer(b_idx, state):
+        return gen[b_idx] | (state & not_kill[b_idx])
+
+    def meet(states):
+        result = 0
+        for s in states:
+            result |= s
+        return result
+
+    return worklist(blocks, cfg, transfer, meet, 0, backward, stats)
@@ -0,0 +1,9 @@
+# counters (e.g. solver iterations) of the pass being profiled, or None
+# when nothing is being profiled, so count() costs next to nothing.
+# driver/profile.py swaps in a dict around each pass and reads it back.
+active = None
+
+def count(name, n=1) -> None:
+    """Add n to a counter of the pass currently being profiled, if any."""
+    if active is not None:
+        active[name] = active.get(name, 0) + n
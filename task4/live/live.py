@@ -2,35 +2,56 @@ import os, sys, json
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from task2.cfg.cfg import basic_blocks, cfg
-from task4.worklist import worklist, flip_cfg
+from task4.worklist import flip_cfg
+from task4.bitvector import Numbering, bitvector_worklist
+from driver.ir import NO_VAR
 
-# Perform reaching definitions analysis on the given function.
+# Perform live variables analysis on the given function.
 def live_vars(func):
     blocks, labels = basic_blocks(func["instrs"], quiet=True)
     graph = cfg(blocks, labels)
     graph = flip_cfg(graph) # live vars should be done backwards
 
-    def transfer(b_idx, state):
-        new_state = set(state)
-        block = blocks[b_idx]
-        for curr_instr in block[::-1]:
-            if "dest" in curr_instr:
-                # var defined here not live before this point
-                new_state.discard(curr_instr["dest"])
+    variables = Numbering()
+    gen = []  # vars used in the block before any redefinition
+    kill = [] # vars defined in the block
+    for block in blocks:
+        used = defined = 0
+        for curr_instr in block:
             if "args" in curr_instr:
                 # vars used here live before this point even if redefined here
-                new_state.update(curr_instr["args"])
-        return new_state
-
-    def meet(states): # union of all live variables
-        result = set()
-        for s in states:
-            result.update(s)
-        return result
-
-    initial = set()
-    state = worklist(blocks, graph, transfer, meet, initial)
-    return state[1]
+                for a in curr_instr["args"]:
+                    used |= variables.bit(a) & ~defined
+            if "dest" in curr_instr:
+                defined |= variables.bit(curr_instr["dest"])
+        gen.append(used)
+        kill.append(defined)
+
+    state = bitvector_worklist(blocks, graph, gen, kill, backward=True)
+    return {b: variables.to_set(bits) for b, bits in state[1].items()}
+
+def live_vars_ir(blocks, graph) -> dict:
+    """Live variables at the input of each block of a driver.ir.Function.
+
+    Variables are already numbered there, so each block's live set is
+    returned as the int bitset of their numbers.
+
+    Args:
+        blocks, graph: as returned by driver.ir's basic_blocks and cfg.
+    """
+    gen = []
+    kill = []
+    for block in blocks:
+        used = defined = 0
+        for instr in block:
+            if instr.args:
+                for a in instr.args:
+                    used |= (1 << a) & ~defined
+            if instr.dest != NO_VAR:
+                defined |= 1 << instr.dest
+        gen.append(used)
+        kill.append(defined)
+    return bitvector_worklist(blocks, flip_cfg(graph), gen, kill, backward=True)[1]
 
 if __name__ == "__main__":
     full_bril = json.load(sys.stdin)
@@ -2,32 +2,39 @@ import os, sys, json
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
 from task2.cfg.cfg import basic_blocks, cfg
-from task4.worklist import worklist
+from task4.bitvector import Numbering, bitvector_worklist
 
 # Perform reaching definitions analysis on the given function.
-def reaching_defs(func):
-    blocks, labels = basic_blocks(func["instrs"], quiet=False)
+def reaching_defs(func, quiet=False):
+    blocks, labels = basic_blocks(func["instrs"], quiet=quiet)
     graph = cfg(blocks, labels)
 
-    def transfer(b_idx, state): # kill and gen
-        new_state = state.copy()
-        block = blocks[b_idx]
-        for curr_instr_idx, curr_instr in enumerate(block):
-            if "dest" in curr_instr:
-                # kill previous definitions of the same variable
-                new_state = [(instr_idx, block_idx) for instr_idx, block_idx in new_state if blocks[block_idx][instr_idx]["dest"] != curr_instr["dest"]]
-                new_state.append((curr_instr_idx, b_idx))
-        return new_state
+    # number every definition (instr_idx, block_idx), grouped by variable
+    definitions = Numbering()
+    defs_of_var = {}
+    for block_idx, block in enumerate(blocks):
+        for instr_idx, instr in enumerate(block):
+            if "dest" in instr:
+                bit = definitions.bit((instr_idx, block_idx))
+                defs_of_var[instr["dest"]] = defs_of_var.get(instr["dest"], 0) | bit
 
-    def meet(states): # union of all reaching definitions
-        result = set()
-        for s in states:
-            result.update(s)
-        return list(result)
+    gen = []  # last definition of each var in the block
+    kill = [] # every definition of the vars the block defines
+    for block_idx, block in enumerate(blocks):
+        last_def = {}
+        for instr_idx, instr in enumerate(block):
+            if "dest" in instr:
+                last_def[instr["dest"]] = definitions.bit((instr_idx, block_idx))
+        gen_bits = kill_bits = 0
+        for var, bit in last_def.items():
+            gen_bits |= bit
+            kill_bits |= defs_of_var[var]
+        gen.append(gen_bits)
+        kill.append(kill_bits)
 
-    initial = []
-    state = worklist(blocks, graph, transfer, meet, initial)
-    return state[0]
+    state = bitvector_worklist(blocks, graph, gen, kill)
+    # definitions were numbered in program order, so they come back in it
+    return {b: definitions.to_list(bits) for b, bits in state[0].items()}
 
 if __name__ == "__main__":
     full_bril = json.load(sys.stdin)
@@ -1,4 +1,6 @@
-from collections import deque
+from heapq import heapify, heappop, heappush
+
+from task4.counters import count
 
 def flip_cfg(cfg) -> dict:
     '''
@@ -11,7 +13,25 @@ def flip_cfg(cfg) -> dict:
             rev[s].append(b)
     return rev
 
-def worklist(blocks, cfg, transfer, meet, initial) -> dict:
+def block_order(cfg, rev, num_blocks, backward=False) -> list:
+    '''
+    Order in which the worklist should first visit blocks: reverse postorder
+    of the CFG for forward problems, postorder for backward problems (where
+    cfg is the flipped graph and rev the original one). Blocks unreachable
+    from the entry block 0 come last, in index order.
+    '''
+    from task5.dominators import postorder # task5.dominators imports this module
+    if num_blocks == 0:
+        return []
+    if backward:
+        order = postorder(rev, 0)
+    else:
+        order = postorder(cfg, 0)[::-1]
+    seen = set(order)
+    order.extend(b for b in range(num_blocks) if b not in seen)
+    return order
+
+def worklist(blocks, cfg, transfer, meet, initial, backward=False, stats=None) -> dict:
     '''
     A generic worklist algorithm for dataflow analysis.
     blocks: list of blocks
@@ -19,17 +39,49 @@ def worklist(blocks, cfg, transfer, meet, initial) -> dict:
     transfer: function(block_idx, state) -> new_state
     meet: function(list_of_states) -> combined_state
     initial: initial state for each block
+    backward: True if cfg is the flipped graph of a backward problem
+    stats: optional dict; "iterations" (blocks popped) and "transfers"
+           (transfer calls) are added to it
+    Blocks are always processed in (reverse) postorder rank and each block is
+    in the worklist at most once, so acyclic regions settle in one pass.
     '''
-    worklist = deque(range(len(blocks)))
-    in_state = {blocks.index(b): initial for b in blocks}
-    out_state = {blocks.index(b): initial for b in blocks}
+    num_blocks = len(blocks)
     rev = flip_cfg(cfg)
-    while worklist:
-        b_idx = worklist.popleft()
-        if rev[b_idx]: in_state[b_idx] = meet([out_state[p] for p in rev[b_idx]]) 
+    order = block_order(cfg, rev, num_blocks, backward)
+    rank = [0] * num_blocks
+    for r, b in enumerate(order):
+        rank[b] = r
+
+    in_state = {b: initial for b in range(num_blocks)}
+    out_state = {b: initial for b in range(num_blocks)}
+    queue = list(range(num_blocks)) # ranks, not block indices
+    heapify(queue)
+    in_queue = bytearray(b'\x01') * num_blocks
+    visited = bytearray(num_blocks)
+    iterations = transfers = 0
+    while queue:
+        b_idx = order[heappop(queue)]
+        in_queue[b_idx] = 0
+        iterations += 1
+        if rev[b_idx]:
+            new_in = meet([out_state[p] for p in rev[b_idx]])
+            if visited[b_idx] and new_in == in_state[b_idx]:
+                continue # nothing new flowed in, out state can't change
+            in_state[b_idx] = new_in
+        elif visited[b_idx]:
+            continue
+        visited[b_idx] = 1
+        transfers += 1
         new_state = transfer(b_idx, in_state[b_idx])
         if new_state != out_state[b_idx]:
             out_state[b_idx] = new_state
             for s in cfg[b_idx]:
-                worklist.append(s)
-    return in_state, out_state
\ No newline at end of file
+                if not in_queue[s]:
+                    in_queue[s] = 1
+                    heappush(queue, rank[s])
+    if stats is not None:
+        stats["iterations"] = stats.get("iterations", 0) + iterations
+        stats["transfers"] = stats.get("transfers", 0) + transfers
+    count("worklist_iterations", iterations)
+    count("worklist_transfers", transfers)
+    return in_state, out_state
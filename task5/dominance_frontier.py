@@ -29,6 +29,8 @@ def dominance_frontier(cfg, dom, dom_tree, entry) -> dict:
 
     # single pass in postorder should be sufficient?
     post = postorder(cfg, entry)
+    # checked once, so the loop doesn't format messages nobody will see
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
 
     for b in post:
         if dom_tree[b]: 
@@ -37,13 +39,14 @@ def dominance_frontier(cfg, dom, dom_tree, entry) -> dict:
                 # add the blocks in c's dominance frontier and children of c 
                 # that b does not strictly dominate to b's dominance frontier
                 for g in df[c].union(cfg[c]):
-                    if b not in dom[g]:
+                    if g == b or b not in dom[g]:  # b does not strictly dominate g
                         df[b].add(g)
         # look at its successors
         for s in cfg[b]:
-            if b not in dom[s]:
+            if s == b or b not in dom[s]:
                 df[b].add(s)
-        logging.debug(f"Block {b}, DF: {df[b]}")
+        if debug:
+            logging.debug(f"Block {b}, DF: {df[b]}")
 
     return df
 
@@ -3,23 +3,17 @@ import argparse, logging
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
-from dominators import dominators
-from dominator_tree import dominator_tree
-from dominance_frontier import dominance_frontier
+from task2.cfg.traversal import reachable_from, walk
+from task5.dominators import dominators
+from task5.dominator_tree import dominator_tree
+from task5.dominance_frontier import dominance_frontier
+from task5.immediate_dominators import immediate_dominators, Dominators
 
 def reachable_without(graph, entry, without):
     # do DFS from entry, except do not interact with node "without"
-    visited = set()
-
-    def visit(node):
-        if node in visited or node == without:
-            return
-        visited.add(node)
-        for succ in graph[node]:
-            visit(succ)
-
-    visit(entry)
-    return visited
+    if entry == without:
+        return set()
+    return reachable_from(graph, [entry], blocked={without})
 
 def brute_force_dominators(graph, entry):
     cfg = reachable_cfg(graph, entry)
@@ -36,12 +30,13 @@ def brute_force_dominators(graph, entry):
 def dominators_from_tree(tree, entry):
     # walk tree collecting path
     doms = {}
-    def doms_from_subtree(root, accumulated_doms):
-        accumulated_doms.append(root)
-        doms[root] = set(accumulated_doms)
-        for c in tree[root]:
-            doms_from_subtree(c, accumulated_doms[:])
-    doms_from_subtree(entry, [])
+    path = []
+    for node, entering in walk(tree, entry):
+        if entering:
+            path.append(node)
+            doms[node] = set(path)
+        else:
+            path.pop()
     return doms
 
 # uses only dominators
@@ -56,7 +51,7 @@ def brute_force_dominance_frontier(graph, dom, entry):
     for b in cfg.keys():
         for d in dominated[b]:
             for s in cfg[d]:
-                if b not in dom[s]:
+                if s == b or b not in dom[s]:  # b does not strictly dominate s
                     df[b].add(s)
         
     return df
@@ -75,11 +70,13 @@ if __name__ == "__main__":
         entry = 0  # Assuming the first block is the entry block
         doms_orig = dominators(graph, entry)
         doms_bf = brute_force_dominators(graph, entry)
+        doms_idom = Dominators(*immediate_dominators(graph, entry))
         tree = dominator_tree(graph, entry)
         doms_from_tree = dominators_from_tree(tree, entry)
         df_bf = brute_force_dominance_frontier(graph, doms_orig, entry)
         df_from_tree = dominance_frontier(graph, doms_from_tree, tree, entry)
         print(" Doms valid:", doms_orig == doms_bf)
+        print(" IDom valid:", doms_idom == doms_bf)
         print(" Tree valid:", doms_orig == doms_from_tree)
         print(" DF valid:", df_bf == df_from_tree)
         if df_bf != df_from_tree:
@@ -3,13 +3,15 @@ import argparse, logging
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
-from .dominators import dominators
+from .immediate_dominators import immediate_dominators, dominator_tree_from_idom
 
 def dominator_tree(cfg, entry) -> dict:
     """Compute the dominator tree for a control flow graph.
 
     The dominator tree represents dominators exactly: 
     each node is a (strict) dominator for all and only its (strict) descendants in the tree.
+    Each node's parent is its immediate dominator, so the tree is read directly
+    off the idom array from immediate_dominators.
 
     Args:
         cfg: A control flow graph represented as a dictionary mapping block
@@ -19,22 +21,8 @@ def dominator_tree(cfg, entry) -> dict:
     Returns:
         A dictionary mapping each block label to the labels of its children in the tree.
     """
-    cfg = reachable_cfg(cfg, entry)
-    doms = dominators(cfg, entry)
-    tree = {entry: []}
-    # If both A and B dominate C, it must be that A dominates B or vice versa
-    # Thus, any nodes' dominators form a path in the tree.
-    for block in cfg.keys():
-        # if it's not added:
-        if block not in tree.keys():
-            # get all its dominators, put them in order (more dominators means later in path)
-            dominators_ordered = sorted(doms[block], key=lambda d: len(doms[d]))
-            # add them to the tree in order
-            for i in range(len(dominators_ordered)-1):
-                if dominators_ordered[i+1] not in tree.keys():
-                    tree[dominators_ordered[i+1]] = []
-                    tree[dominators_ordered[i]].append(dominators_ordered[i+1])
-    return tree
+    rpo, idom = immediate_dominators(cfg, entry)
+    return dominator_tree_from_idom(rpo, idom)
 
 
 
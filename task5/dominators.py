@@ -4,8 +4,10 @@ import argparse, logging
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
 from task4.worklist import flip_cfg
+from task2.cfg.traversal import DepthFirstSearch
+from task4.counters import count
 
-def dominators(cfg, entry) -> dict:
+def dominators(cfg, entry, stats=None) -> dict:
     """Compute the dominator sets for each block in a control flow graph.
 
     A block D is said to dominate a block B if every path from the entry block
@@ -15,6 +17,8 @@ def dominators(cfg, entry) -> dict:
         cfg: A control flow graph represented as a dictionary mapping block
             labels to lists of successor block labels.
         entry: The label of the entry block.
+        stats: Optionally, a dict whose "iterations" entry is incremented
+            once per pass over the blocks.
 
     Returns:
         A dictionary mapping each block label to the set of labels of blocks
@@ -26,23 +30,32 @@ def dominators(cfg, entry) -> dict:
     dom[entry] = {entry}
     flipped_cfg = flip_cfg(cfg)
     rev_post = postorder(cfg, entry)[::-1]
-    logging.debug(f"Reverse postorder: {rev_post}")
+    # checked once, so the loop doesn't format messages nobody will see
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if debug:
+        logging.debug(f"Reverse postorder: {rev_post}")
 
+    iterations = 0
     changed = True
     while changed:
         changed = False
+        iterations += 1
         for block in rev_post:
             if block == entry:
                 continue
             if flipped_cfg[block]:
-                logging.debug(f"Block {block}, predecessors: {flipped_cfg[block]}") 
+                if debug:
+                    logging.debug(f"Block {block}, predecessors: {flipped_cfg[block]}")
                 update = set.intersection(*[dom[pred] for pred in flipped_cfg[block]]) | {block}
                 if dom[block] != update:
                     dom[block] = update
                     changed = True
-            else:
+            elif debug:
                 logging.debug(f"Warning: block {block} has no predecessors")
 
+    if stats is not None:
+        stats["iterations"] = stats.get("iterations", 0) + iterations
+    count("dominators_iterations", iterations)
     return dom
 
 def postorder(cfg, entry) -> list:
@@ -56,19 +69,7 @@ def postorder(cfg, entry) -> list:
     Returns:
         A list of block labels in postorder.
     """
-    visited = set()
-    postorder = []
-
-    def visit(node):
-        if node in visited:
-            return
-        visited.add(node)
-        for succ in cfg[node]:
-            visit(succ)
-        postorder.append(node)
-
-    visit(entry)
-    return postorder
+    return DepthFirstSearch(cfg, entry).postorder
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -0,0 +1,187 @@
+import os, sys, json
+import argparse, logging
+from collections.abc import Mapping, Set
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks, cfg
+from task5.dominators import postorder
+from task4.counters import count
+
+def immediate_dominators(cfg, entry, stats=None) -> tuple:
+    """Compute immediate dominators with the Cooper-Harvey-Kennedy algorithm.
+
+    Blocks are numbered in reverse postorder, so each block's immediate
+    dominator is found by walking two idom chains towards smaller numbers
+    until they meet. Only blocks reachable from the entry are numbered.
+
+    Args:
+        cfg: A control flow graph represented as a dictionary mapping block
+            labels to lists of successor block labels.
+        entry: The label of the entry block.
+        stats: Optionally, a dict whose "iterations" entry is incremented
+            once per pass over the blocks.
+
+    Returns:
+        A tuple (rpo, idom): rpo lists the reachable block labels in reverse
+        postorder and idom[i] is the RPO number of the immediate dominator
+        of rpo[i]. The entry block is numbered 0 and is its own idom.
+    """
+    rpo = postorder(cfg, entry)[::-1]
+    num = {b: i for i, b in enumerate(rpo)}
+    preds = [[] for _ in rpo]
+    for b in rpo:
+        for s in cfg[b]:
+            preds[num[s]].append(num[b])
+
+    idom = [-1] * len(rpo)
+    idom[0] = 0
+    iterations = 0
+    changed = True
+    while changed:
+        changed = False
+        iterations += 1
+        for i in range(1, len(rpo)):
+            new_idom = -1
+            for p in preds[i]:
+                if idom[p] == -1:
+                    continue # not processed yet
+                if new_idom == -1:
+                    new_idom = p
+                    continue
+                # intersect: walk up from both until the paths meet
+                a, b = p, new_idom
+                while a != b:
+                    while a > b:
+                        a = idom[a]
+                    while b > a:
+                        b = idom[b]
+                new_idom = a
+            if idom[i] != new_idom:
+                idom[i] = new_idom
+                changed = True
+    if stats is not None:
+        stats["iterations"] = stats.get("iterations", 0) + iterations
+    count("idom_iterations", iterations)
+    return rpo, idom
+
+def dominator_tree_from_idom(rpo, idom) -> dict:
+    """Build the dominator tree (block label -> children labels) from idom.
+
+    Blocks are added in the order dominator_tree used to add them from the
+    dominator sets: in index order, each after the dominators above it that
+    were not in the tree yet. Children are listed in that order too, so
+    walks of the tree (e.g. SSA renaming) number things the same way.
+    """
+    if not rpo:
+        return {}
+    parent = {rpo[i]: rpo[idom[i]] for i in range(1, len(rpo))}
+    tree = {rpo[0]: []}
+    for b in sorted(rpo):
+        chain = []
+        while b not in tree:
+            chain.append(b)
+            b = parent[b]
+        for c in reversed(chain):
+            tree[parent[c]].append(c)
+            tree[c] = []
+    return tree
+
+class DominatorSet(Set):
+    """The set of dominators of one block, answered from Dominators."""
+    def __init__(self, doms, block):
+        self.doms = doms
+        self.block = block
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    def __contains__(self, d):
+        return self.doms.dominates(d, self.block)
+
+    def __iter__(self):
+        idom, rpo = self.doms.idom, self.doms.rpo
+        i = self.doms.num[self.block]
+        while i != 0:
+            yield rpo[i]
+            i = idom[i]
+        yield rpo[0]
+
+    def __len__(self):
+        return self.doms.depth[self.doms.num[self.block]] + 1
+
+    def __repr__(self):
+        return repr(set(self))
+
+class Dominators(Mapping):
+    """Dominator sets of every reachable block, derived lazily from idom.
+
+    Behaves like the dict returned by dominators(), but nothing is stored
+    per block beyond a few ints: membership tests "a in doms[b]" are O(1)
+    using preorder intervals of the dominator tree.
+    """
+    def __init__(self, rpo, idom):
+        self.rpo = rpo
+        self.idom = idom
+        self.num = {b: i for i, b in enumerate(rpo)}
+        n = len(rpo)
+        children = [[] for _ in range(n)]
+        for i in range(1, n):
+            children[idom[i]].append(i)
+        # pre[i] <= pre[j] <= last[i] iff i dominates j
+        self.pre = [0] * n
+        self.last = [0] * n
+        self.depth = [0] * n
+        counter = 0
+        stack = [(0, False)] if n else []
+        while stack:
+            i, done = stack.pop()
+            if done:
+                self.last[i] = counter - 1
+                continue
+            self.pre[i] = counter
+            counter += 1
+            stack.append((i, True))
+            for c in children[i]:
+                self.depth[c] = self.depth[i] + 1
+                stack.append((c, False))
+
+    def dominates(self, a, b) -> bool:
+        """Whether block a dominates block b."""
+        i, j = self.num.get(a), self.num.get(b)
+        if i is None or j is None:
+            return False
+        return self.pre[i] <= self.pre[j] <= self.last[i]
+
+    def immediate(self, b):
+        """The immediate dominator of b (None for the entry block)."""
+        i = self.num[b]
+        return self.rpo[self.idom[i]] if i != 0 else None
+
+    def __getitem__(self, b):
+        if b not in self.num:
+            raise KeyError(b)
+        return DominatorSet(self, b)
+
+    def __iter__(self):
+        return iter(self.rpo)
+
+    def __len__(self):
+        return len(self.rpo)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    full_bril = json.load(sys.stdin)
+    for func in full_bril["functions"]:
+        print("Function:", func["name"])
+        blocks, labels = basic_blocks(func["instrs"], quiet=True)
+        graph = cfg(blocks, labels)
+        entry = 0  # Assuming the first block is the entry block
+        rpo, idom = immediate_dominators(graph, entry)
+        for i, b in enumerate(rpo):
+            print("Block", b, "is immediately dominated by:", rpo[idom[i]] if i else None)
+        print()
@@ -0,0 +1,364 @@
+import os, sys, json
+from array import array
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import reachable_cfg
+from task2.cfg.traversal import DepthFirstSearch
+from task4.worklist import flip_cfg
+from task5.immediate_dominators import immediate_dominators
+from driver.ir import from_bril, to_bril, basic_blocks, cfg, Instr, Label, BR, JMP, RET, LABEL
+
+TERMINATORS = (BR, JMP, RET)
+
+class MutableCFG:
+    """The basic blocks, CFG and dominator tree of a function in the
+    internal IR (driver.ir), kept in sync through edits.
+
+    Blocks keep the id they were created with (initially their index in
+    basic_blocks), and their layout is a linked list, so no edit renumbers
+    or scans the whole function. Every edit rewrites the affected branch
+    instructions itself, adding labels and jumps wherever a fallthrough
+    would otherwise go to the wrong block.
+
+    The immediate dominators are updated in place for the common edits
+    (inserting a block in front of another, e.g. a preheader, splitting an
+    edge, merging a block into its only predecessor, adding an edge that
+    can't bypass anything, removing a back edge). Any other edit marks them
+    stale and they are recomputed the next time they are asked for.
+
+    Attributes:
+        blocks: dict mapping block id to its list of driver.ir instructions.
+        labels: dict mapping label to block id.
+        succs: dict mapping block id to successor ids, as in cfg().
+        preds: dict mapping block id to predecessor ids.
+        entry: id of the entry block.
+    """
+    def __init__(self, blocks, labels, graph=None, idom=None, entry=0):
+        self.blocks = dict(enumerate(blocks))
+        self.labels = dict(labels)
+        self.succs = {b: list(s) for b, s in (graph or cfg(blocks, labels)).items()}
+        self.preds = flip_cfg(self.succs)
+        self.entry = entry
+        self.head = 0 if blocks else None
+        self.next = {b: b + 1 for b in range(len(blocks) - 1)}
+        self.prev = {b + 1: b for b in range(len(blocks) - 1)}
+        if blocks:
+            self.next[len(blocks) - 1] = None
+            self.prev[0] = None
+        self.next_id = len(blocks)
+        self.idom = None  # block -> immediate dominator, None for the entry
+        self.children = None
+        if idom is not None:
+            rpo, nums = idom
+            self.set_idom({b: rpo[nums[i]] if i else None for i, b in enumerate(rpo)})
+
+    @classmethod
+    def from_analyses(cls, am):
+        """Build from a FunctionAnalyses, reusing its blocks, cfg and idom."""
+        blocks, labels = am.get("blocks")
+        return cls(blocks, labels, am.get("cfg"), am.get("idom"), am.entry)
+
+    def set_idom(self, idom) -> None:
+        self.idom = idom
+        self.children = {b: [] for b in idom}
+        for b, d in idom.items():
+            if d is not None:
+                self.children[d].append(b)
+
+    def dominator_tree(self) -> dict:
+        """The immediate dominators, recomputed first if they are stale."""
+        if self.idom is None:
+            graph = reachable_cfg(self.succs, self.entry) if self.blocks else {}
+            rpo, nums = immediate_dominators(graph, self.entry) if graph else ([], [])
+            self.set_idom({b: rpo[nums[i]] if i else None for i, b in enumerate(rpo)})
+        return self.idom
+
+    def reachable(self, b) -> bool:
+        return b in self.dominator_tree()
+
+    def dominates(self, a, b) -> bool:
+        idom = self.dominator_tree()
+        if a not in idom:
+            return False
+        while b is not None and b != a:
+            b = idom.get(b)
+        return b == a
+
+    def nca(self, blocks):
+        """Nearest common dominator of some reachable blocks."""
+        idom = self.dominator_tree()
+        result = None
+        for b in blocks:
+            if result is None:
+                result = b
+                continue
+            ancestors = set()
+            while result is not None:
+                ancestors.add(result)
+                result = idom[result]
+            while b not in ancestors:
+                b = idom[b]
+            result = b
+        return result
+
+    def _set_parent(self, b, d) -> None:
+        old = self.idom.get(b)
+        if old is not None:
+            self.children[old].remove(b)
+        self.idom[b] = d
+        self.children.setdefault(b, [])
+        if d is not None:
+            self.children[d].append(b)
+
+    def fresh_label(self, base) -> str:
+        label, n = base, 0
+        while label in self.labels:
+            n += 1
+            label = f"{base}.{n}"
+        return label
+
+    def label(self, b) -> str:
+        """The label of block b, giving it a new one if it has none."""
+        block = self.blocks[b]
+        if block[0].op != LABEL:
+            block.insert(0, Label(self.fresh_label(f"__block{b}")))
+            self.labels[block[0].label] = b
+        return block[0].label
+
+    def falls_through(self, b) -> bool:
+        return self.blocks[b][-1].op not in TERMINATORS
+
+    def _link_after(self, w, p) -> None:
+        """Put block w in the layout after p (at the front if p is None)."""
+        n = self.head if p is None else self.next[p]
+        self.prev[w], self.next[w] = p, n
+        if p is None:
+            self.head = w
+        else:
+            self.next[p] = w
+        if n is not None:
+            self.prev[n] = w
+
+    def _unlink(self, b) -> None:
+        p, n = self.prev.pop(b), self.next.pop(b)
+        if p is None:
+            self.head = n
+        else:
+            self.next[p] = n
+        if n is not None:
+            self.prev[n] = p
+
+    def _add_jmp(self, b, target) -> None:
+        self.blocks[b].append(Instr(JMP, labels=[self.label(target)]))
+
+    def _retarget(self, u, old, new) -> None:
+        """Send u's edges to old to new instead, in the instructions and the graph."""
+        term = self.blocks[u][-1]
+        if term.op == BR or term.op == JMP:
+            old_label, new_label = self.label(old), self.label(new)
+            term.labels = [new_label if l == old_label else l for l in term.labels]
+        elif self.next[u] != new:
+            self._add_jmp(u, new)
+        n = self.succs[u].count(old)
+        self.succs[u] = [new if s == old else s for s in self.succs[u]]
+        self.preds[old] = [p for p in self.preds[old] if p != u]
+        self.preds[new].extend([u] * n)
+
+    def insert_block_before(self, v, preds, instrs=(), take_entry=False, label=None):
+        """Insert a new block on the edges from preds into v.
+
+        The new block holds instrs and then goes straight to v. With
+        take_entry, v must be the entry block and the new block becomes the
+        entry instead, as if the function's start were one more predecessor.
+
+        Returns:
+            The id of the new block.
+        """
+        preds = list(dict.fromkeys(preds))
+        if take_entry and v != self.entry:
+            raise ValueError("only the entry block's place as entry can be taken")
+        w = self.next_id
+        self.next_id += 1
+        name = self.fresh_label(label or self.label(v) + "__pre")
+        self.blocks[w] = [Label(name)] + list(instrs)
+        self.labels[name] = w
+        self.succs[w] = []
+        self.preds[w] = []
+
+        # put w right in front of v so it can fall through, unless that
+        # would make it the entry when it shouldn't be
+        if v == self.head and not take_entry:
+            tail = v
+            while self.next[tail] is not None:
+                tail = self.next[tail]
+            if self.falls_through(tail):
+                self.blocks[tail].append(Instr(RET))  # it fell off the end
+            self._link_after(w, tail)
+            self._add_jmp(w, v)
+        else:
+            p = self.prev[v]
+            if p is not None and p not in preds and self.falls_through(p) and v in self.succs[p]:
+                self._add_jmp(p, v)
+            self.label(v)  # so it stays a block of its own after w
+            self._link_after(w, p)
+        for p in preds:
+            self._retarget(p, v, w)
+        self.succs[w] = [v]
+        self.preds[v].append(w)
+        if take_entry:
+            self.entry = w
+
+        if self.idom is None or (v not in self.idom and not take_entry):
+            return w
+        if take_entry:
+            self._set_parent(w, None)
+            self._set_parent(v, w)
+            return w
+        reachable = [p for p in preds if p in self.idom]
+        if not reachable:
+            return w
+        self._set_parent(w, self.nca(reachable))
+        # v now hangs off w unless it can still be entered some other way
+        # (the entry always can); either way nothing else changes
+        if v != self.entry and all(p == w or p not in self.idom or self.dominates(v, p) for p in self.preds[v]):
+            self._set_parent(v, w)
+        return w
+
+    def split_edge(self, u, v):
+        """Put a new, empty block on the edge from u to v; returns its id."""
+        return self.insert_block_before(v, [u])
+
+    def insert_preheader(self, header, loop_blocks, label=None):
+        """Give a loop a preheader: a new block that every edge into header
+        from outside the loop goes through. Returns its id."""
+        outside = [p for p in self.preds[header] if p not in loop_blocks]
+        return self.insert_block_before(header, outside, take_entry=header == self.entry,
+                                        label=label or self.label(header) + "__preheader")
+
+    def merge_blocks(self, a, b) -> None:
+        """Append block b to a, which must be its only predecessor, and
+        whose only successor b must be."""
+        if a == b or b == self.entry or set(self.succs[a]) != {b} or set(self.preds[b]) != {a}:
+            raise ValueError(f"can't merge block {b} into {a}")
+        if self.blocks[a][-1].op in (BR, JMP):
+            self.blocks[a].pop()
+        body = self.blocks.pop(b)
+        if body[0].op == LABEL:
+            del self.labels[body[0].label]
+            body = body[1:]
+        falls = not body or body[-1].op not in TERMINATORS
+        falls_to = self.next[b]
+        self._unlink(b)
+        self.blocks[a].extend(body)
+        if not self.blocks[a]:
+            self.blocks[a].append(Label(self.fresh_label(f"__block{a}")))
+            self.labels[self.blocks[a][0].label] = a
+        if falls and self.next[a] != falls_to:
+            if falls_to is None:
+                self.blocks[a].append(Instr(RET))  # b fell off the end
+            else:
+                self._add_jmp(a, falls_to)
+        self.succs[a] = self.succs.pop(b)
+        del self.preds[b]
+        for s in self.succs[a]:
+            self.preds[s] = [a if p == b else p for p in self.preds[s]]
+        if self.idom is not None and b in self.idom:
+            for c in list(self.children[b]):
+                self._set_parent(c, a)
+            self._set_parent(b, None)
+            del self.idom[b], self.children[b]
+
+    def _edge_added(self, u, v) -> None:
+        # a new edge into v from somewhere idom(v) already dominates can't
+        # create a path around any dominator
+        if self.idom is None or u not in self.idom:
+            return
+        if v not in self.idom or not self.dominates(self.idom[v] if self.idom[v] is not None else v, u):
+            self.idom = self.children = None
+
+    def _edge_removed(self, u, v) -> None:
+        # dropping a back edge removes no path that doesn't repeat v
+        if self.idom is None or u not in self.idom or v in self.succs[u]:
+            return
+        if not self.dominates(v, u):
+            self.idom = self.children = None
+
+    def redirect_edge(self, u, old, new) -> None:
+        """Make u branch to new wherever it branched (or fell through) to old."""
+        self._retarget(u, old, new)
+        self._edge_added(u, new)
+        self._edge_removed(u, old)
+
+    def add_edge(self, u, v, cond) -> None:
+        """Turn u's jump (or fallthrough) into br cond, to v if cond is true.
+        cond is the interned number of a bool variable."""
+        if len(self.succs[u]) != 1 or self.blocks[u][-1].op in (BR, RET):
+            raise ValueError(f"block {u} does not end in an unconditional jump")
+        (s,) = self.succs[u]
+        if self.blocks[u][-1].op == JMP:
+            self.blocks[u].pop()
+        self.blocks[u].append(Instr(BR, args=array("i", [cond]),
+                                    labels=[self.label(v), self.label(s)]))
+        self.succs[u] = [v, s]
+        self.preds[v].append(u)
+        self._edge_added(u, v)
+
+    def remove_edge(self, u, v) -> None:
+        """Remove the edge from u to v out of u's conditional branch."""
+        term = self.blocks[u][-1]
+        rest = [s for s in self.succs[u] if s != v]
+        if term.op != BR or not rest:
+            raise ValueError(f"block {u} has no other way out than to {v}")
+        self.blocks[u][-1] = Instr(JMP, labels=[self.label(rest[0])])
+        self.succs[u] = [rest[0]]
+        self.preds[v] = [p for p in self.preds[v] if p != u]
+        self._edge_removed(u, v)
+
+    def layout(self) -> list:
+        order = []
+        b = self.head
+        while b is not None:
+            order.append(b)
+            b = self.next[b]
+        return order
+
+    def instrs(self) -> list:
+        return [instr for b in self.layout() for instr in self.blocks[b]]
+
+    def write_back(self, func, am=None) -> None:
+        """Store the edited instructions in func, a driver.ir.Function.
+
+        If am is func's FunctionAnalyses, it is invalidated and then handed
+        the blocks, cfg and immediate dominators as they are, renumbered to
+        the new layout, so they aren't recomputed from scratch.
+        """
+        order = self.layout()
+        func.instrs = [instr for b in order for instr in self.blocks[b]]
+        if am is None:
+            return
+        am.invalidate()
+        num = {b: i for i, b in enumerate(order)}
+        blocks = [self.blocks[b] for b in order]
+        labels = {l: num[b] for l, b in self.labels.items()}
+        graph = {num[b]: [num[s] for s in self.succs[b]] for b in order}
+        am.set("blocks", (blocks, labels))
+        am.set("cfg", graph)
+        if self.idom is not None and num[self.entry] == am.entry:
+            rpo = DepthFirstSearch(graph, am.entry).rpo
+            pos = {b: i for i, b in enumerate(rpo)}
+            idom = [pos[num[self.idom[order[b]]]] if i else 0 for i, b in enumerate(rpo)]
+            am.set("idom", (rpo, idom))
+
+if __name__ == "__main__":
+    # split every critical edge and print the result
+    full_bril = json.load(sys.stdin)
+    for i, func in enumerate(full_bril["functions"]):
+        ir_func = from_bril(func)
+        mcfg = MutableCFG(*basic_blocks(ir_func.instrs))
+        for u in list(mcfg.succs):
+            for v in list(dict.fromkeys(mcfg.succs[u])):
+                if len(mcfg.succs[u]) > 1 and len(mcfg.preds[v]) > 1:
+                    mcfg.split_edge(u, v)
+        mcfg.write_back(ir_func)
+        full_bril["functions"][i] = to_bril(ir_func)
+    print(json.dumps(full_bril))
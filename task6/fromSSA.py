@@ -1,4 +1,10 @@
-import sys, json
+import os, sys, json
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from task2.cfg.cfg import basic_blocks, cfg
+from task4.live.live import live_vars
+from driver.stream import stream_functions
 
 def get_types(func):
     types = {}
@@ -28,8 +34,228 @@ def from_ssa(instrs, var_types):
                     "args": ["shadow_" + instrs[i]["dest"]]
                 }
 
+def from_ssa_func(func):
+    from_ssa(func["instrs"], get_types(func))
+
+def copy_groups(instrs, var_types) -> tuple[list, list]:
+    """Replace sets and gets with copies through shadow variables, like
+    from_ssa, and collect each run of consecutive sets (or gets) as a
+    parallel copy group.
+
+    Sets only read ordinary variables and only write shadow ones, and gets
+    the other way round, so the copies within a run can be done in any
+    order. Sets of a shadow that nothing gets are dropped.
+
+    Returns:
+        The new instructions and a list of groups, each a list of the
+        indices of its copies in the new instructions.
+    """
+    new_instrs = []
+    groups = []
+    prev = None
+    for instr in instrs:
+        op = instr.get("op")
+        if op == "set":
+            if instr["args"][0] not in var_types:
+                continue
+            instr = {"op": "id", "dest": "shadow_" + instr["args"][0],
+                     "type": var_types[instr["args"][0]], "args": [instr["args"][1]]}
+        elif op == "get":
+            instr = {"op": "id", "dest": instr["dest"], "type": instr["type"],
+                     "args": ["shadow_" + instr["dest"]]}
+        if op in ("set", "get"):
+            if op != prev:
+                groups.append([])
+            groups[-1].append(len(new_instrs))
+        prev = op
+        new_instrs.append(instr)
+    return new_instrs, groups
+
+def interference(func, instrs, groups) -> dict:
+    """Build the interference graph of the variables of a function.
+
+    A variable interferes with everything live just after it is defined,
+    except the variable it is copied from. The copies of a group happen
+    all at once: their dests interfere with each other and with whatever is
+    live after the whole group. Function arguments are defined together on
+    entry, so they interfere with each other and with anything live there.
+    """
+    adj = {}
+    def edge(a, b):
+        adj.setdefault(a, set()).add(b)
+        adj.setdefault(b, set()).add(a)
+
+    group_of = {}
+    for g in groups:
+        for i in g:
+            group_of[i] = g
+    blocks, labels = basic_blocks(instrs, quiet=True)
+    graph = cfg(blocks, labels)
+    live_in = live_vars({"instrs": instrs})
+    # indices of instrs in each block, so group membership can be checked
+    starts = []
+    i = 0
+    for block in blocks:
+        starts.append(i)
+        i += len(block)
+
+    entry_live = set()
+    for b in range(len(blocks) - 1, -1, -1):
+        live = set()
+        for s in graph[b]:
+            live |= live_in[s]
+        i = starts[b] + len(blocks[b]) - 1
+        while i >= starts[b]:
+            instr = instrs[i]
+            if i in group_of:
+                g = group_of[i]
+                copies = [(instrs[j]["dest"], instrs[j]["args"][0]) for j in g]
+                for d, src in copies:
+                    for v in live:
+                        if v != d and v != src:
+                            edge(d, v)
+                    for d2, _ in copies:
+                        if d2 != d:
+                            edge(d, d2)
+                live -= {d for d, _ in copies}
+                live |= {src for _, src in copies}
+                i = g[0] - 1
+                continue
+            if "dest" in instr:
+                d = instr["dest"]
+                src = instr["args"][0] if instr.get("op") == "id" else None
+                for v in live:
+                    if v != d and v != src:
+                        edge(d, v)
+                live.discard(d)
+            live.update(instr.get("args", []))
+            i -= 1
+        if b == 0:
+            entry_live = live
+
+    args = [a["name"] for a in func.get("args", [])]
+    for a in args:
+        for v in entry_live | set(args):
+            if v != a:
+                edge(a, v)
+    return adj
+
+def sequentialize(copies, new_temp) -> list:
+    """Order a parallel copy as a list of sequential (dest, src) copies.
+
+    A copy is done once nothing still to be copied reads its dest. When only
+    cycles are left, one dest of a cycle is saved to a temporary (from
+    new_temp(dest)) first, so each cycle costs a single extra copy.
+    """
+    src_of = {d: s for d, s in copies if d != s}
+    readers = {}
+    for s in src_of.values():
+        readers[s] = readers.get(s, 0) + 1
+    ready = [d for d in src_of if not readers.get(d)]
+    result = []
+    while src_of:
+        while ready:
+            d = ready.pop()
+            s = src_of.pop(d)
+            result.append((d, s))
+            readers[s] -= 1
+            if readers[s] == 0 and s in src_of:
+                ready.append(s)
+        if src_of:
+            # everything left is on a cycle; break it at d
+            d = next(iter(src_of))
+            t = new_temp(d)
+            result.append((t, d))
+            for x, s in src_of.items():
+                if s == d:
+                    src_of[x] = t
+            readers[t] = readers.pop(d)
+            ready.append(d)
+    return result
+
+def from_ssa_coalesce(func) -> None:
+    """Convert a function out of SSA form, coalescing copies.
+
+    Starts from the same shadow-variable copies as from_ssa, then merges
+    every copy-related pair of variables that do not interfere (union-find,
+    with the interference graph updated as classes merge) so most copies
+    become self copies and disappear. The parallel copies that remain are
+    sequentialized, using a temporary for each cycle.
+    """
+    var_types = get_types(func)
+    instrs, groups = copy_groups(func["instrs"], var_types)
+    for instr in instrs:
+        if "dest" in instr:
+            var_types[instr["dest"]] = instr["type"]
+    adj = interference(func, instrs, groups)
+
+    parent = {}
+    def find(v):
+        root = v
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while v != root:
+            parent[v], v = root, parent[v]
+        return root
+
+    for g in groups:
+        for i in g:
+            a, b = find(instrs[i]["dest"]), find(instrs[i]["args"][0])
+            if a == b or b in adj.get(a, ()) or var_types.get(b) != var_types[a]:
+                continue
+            parent[b] = a
+            for n in adj.pop(b, ()):
+                adj[n].discard(b)
+                adj[n].add(a)
+                adj.setdefault(a, set()).add(n)
+
+    # name each class after its function argument if it has one, otherwise
+    # after its first ordinary (non-shadow) member
+    names = {}
+    for a in func.get("args", []):
+        names[find(a["name"])] = a["name"]
+    for instr in instrs:
+        for v in [instr["dest"]] if "dest" in instr else []:
+            r = find(v)
+            if r not in names or (names[r].startswith("shadow_") and not v.startswith("shadow_")):
+                names[r] = v
+    def rename(v):
+        return names.get(find(v), v)
+
+    used = set(var_types) | set(names.values())
+    def new_temp(d):
+        n = 0
+        while f"__swap.{n}" in used:
+            n += 1
+        used.add(f"__swap.{n}")
+        var_types[f"__swap.{n}"] = var_types[d]
+        return f"__swap.{n}"
+
+    group_start = {g[0]: g for g in groups}
+    in_group = {i for g in groups for i in g}
+    new_instrs = []
+    for i, instr in enumerate(instrs):
+        if i in group_start:
+            copies = [(rename(instrs[j]["dest"]), rename(instrs[j]["args"][0]))
+                      for j in group_start[i]]
+            for d, s in sequentialize(copies, new_temp):
+                new_instrs.append({"op": "id", "dest": d, "type": var_types[d], "args": [s]})
+            continue
+        if i in in_group:
+            continue
+        if "dest" in instr:
+            instr["dest"] = rename(instr["dest"])
+        if "args" in instr:
+            instr["args"] = [rename(a) for a in instr["args"]]
+        if instr.get("op") == "id" and instr["args"][0] == instr["dest"]:
+            continue
+        new_instrs.append(instr)
+    func["instrs"] = new_instrs
+
 if __name__ == "__main__":
-    full_bril = json.load(sys.stdin)
-    for func in full_bril["functions"]:
-        from_ssa(func["instrs"], get_types(func))
-    print(json.dumps(full_bril))
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--coalesce", action="store_true",
+                        help="coalesce non-interfering copies instead of keeping every shadow copy")
+    args = parser.parse_args()
+    stream_functions(from_ssa_coalesce if args.coalesce else from_ssa_func, args.jobs)
\ No newline at end of file
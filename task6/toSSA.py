@@ -1,5 +1,6 @@
 import os, sys, json
 import argparse, logging
+from array import array
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from task4.worklist import flip_cfg
@@ -7,6 +8,12 @@ from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
 from task5.dominators import dominators, postorder
 from task5.dominator_tree import dominator_tree
 from task5.dominance_frontier import dominance_frontier
+from task2.cfg.traversal import reachable_from, walk
+from task4.live.live import live_vars_ir
+from driver.ir import from_bril, to_bril, Instr, Label, GET, SET, UNDEF, JMP, BR, LABEL, NO_VAR
+from driver.ir import basic_blocks as ir_basic_blocks, cfg as ir_cfg
+from driver.stream import stream_functions
+from driver.analysis import FunctionAnalyses, CFG_ANALYSES
 
 def get_defs(func) -> dict:
     """Get the set of variables defined in a function, including function arguments.
@@ -57,28 +64,36 @@ def get_uses(func) -> dict:
                 defined.add(instr["dest"])
     return vars
 
-def get_defs_uses_types(func) -> tuple[dict,dict,dict]:
+def get_defs_uses_types(func, blocks) -> tuple[dict,dict,dict]:
+    """Blocks defining and using each variable of a driver.ir.Function.
+
+    Returns:
+        (defs, uses, types), each keyed by variable number: the blocks
+        assigning it (-1 for a function argument), the blocks using it
+        before any assignment in the same block, and its type.
+    """
     defs = {}
     uses = {}
     types = {}
-    for arg in func.get("args", []):
-        defs[arg["name"]] = [-1]
-        types[arg["name"]] = arg["type"]
-    
-    blocks, _ = basic_blocks(func["instrs"], quiet=True)
+    num = func.names.num
+    for arg in func.args or []:
+        defs[num(arg["name"])] = [-1]
+        types[num(arg["name"])] = arg["type"]
+
     for i, block in enumerate(blocks):
         for instr in block:
-            if "args" in instr:
-                for arg in instr["args"]:
-                    if arg not in defs or i not in defs[arg]:
+            if instr.args:
+                for arg in instr.args:
+                    # blocks are visited in order, so i is last if it is there at all
+                    if arg not in defs or defs[arg][-1] != i:
                         if arg not in uses:
                             uses[arg] = []
                         uses[arg].append(i)
-            if "dest" in instr:
-                if instr["dest"] not in defs:
-                    defs[instr["dest"]] = []
-                defs[instr["dest"]].append(i)
-                types[instr["dest"]] = instr["type"]
+            if instr.dest != NO_VAR:
+                if instr.dest not in defs:
+                    defs[instr.dest] = []
+                defs[instr.dest].append(i)
+                types[instr.dest] = instr.type
 
     return defs, uses, types
 
@@ -119,103 +134,198 @@ def add_phi_nodes(func, df, vars) -> dict:
     # flatten blocks back into instrs
     func["instrs"] = [instr for block in blocks for instr in block]
     
-def add_phi_nodes_new(func, def_blocks, use_blocks, types) -> dict:
-    blocks, labels = basic_blocks(func["instrs"], quiet=True)
-    graph = cfg(blocks, labels)
-    flipped_graph = flip_cfg(graph)
-    phi_placed = {}
+def get_instr(var, type) -> Instr:
+    return Instr(GET, var, type, array("i"))
+
+def add_phi_nodes_new(func, def_blocks, use_blocks, types, blocks, flipped_graph) -> None:
     def place_nodes(block_idx, var):
-        if var in phi_placed and block_idx in phi_placed[var]:
-            return
         # place phi node in block
-        insert_pt = 0
-        if "label" in blocks[block_idx][0]:
-            insert_pt = 1
-        blocks[block_idx].insert(insert_pt, {"op": "get", "args": [], "dest": var, "type": types[var]}) # TODO: need types!
-        # add block to list of placed
-        if var not in phi_placed:
-            phi_placed[var] = []
-        phi_placed[var].append(block_idx)
-        # recurse on predecessors not in def_blocks:
-        for b in flipped_graph[block_idx]:
-            if b not in def_blocks[var]:
-                place_nodes(b, var)
-    
+        insert_pt = 1 if blocks[block_idx][0].op == LABEL else 0
+        blocks[block_idx].insert(insert_pt, get_instr(var, types[var]))
+
     for v in use_blocks:
-        for b in use_blocks[v]:
+        # every use block, and every predecessor reachable from one
+        # without going through a block that defines v, needs a get
+        for b in reachable_from(flipped_graph, use_blocks[v], blocked=set(def_blocks[v])):
             place_nodes(b, v)
-    
+
     # flatten blocks back into instrs
-    func["instrs"] = [instr for block in blocks for instr in block]
+    func.instrs = [instr for block in blocks for instr in block]
 
+def add_phi_nodes_pruned(def_blocks, types, blocks, df, live_in) -> None:
+    """Insert gets at the iterated dominance frontier of each variable's
+    definitions, only where the variable is live on entry.
 
-# TODO: handle cases where var is undefined along some paths (add undef?)
-def rename_vars(func, dom_tree, vars) -> None:
+    Args:
+        def_blocks: dict of (var: List) pairs of variable numbers and blocks
+            where var is assigned (-1 for function arguments). Every variable
+            live into the entry block must already have a definition there.
+        types: dict of variable numbers to types.
+        blocks: the function's basic blocks; gets are inserted into them.
+        df: dominance frontier as returned by dominance_frontier.
+        live_in: dict of block to the bitset of variables live on entry to
+            it, as returned by live_vars_ir.
+    """
+    for var, defs in def_blocks.items():
+        # arguments are defined on entry
+        worklist = [0 if b == -1 else b for b in defs]
+        in_idf = set()
+        while worklist:
+            b = worklist.pop()
+            for d in df.get(b, ()):
+                if d not in in_idf:
+                    in_idf.add(d)
+                    worklist.append(d)
+        for d in sorted(in_idf):
+            if live_in[d] >> var & 1:
+                insert_pt = 1 if blocks[d][0].op == LABEL else 0
+                blocks[d].insert(insert_pt, get_instr(var, types[var]))
+
+def rename_vars(func, dom_tree, vars, blocks=None, graph=None) -> None:
     """Rename variables in a function to ensure each variable is assigned exactly once.
 
     Args:
-        func: a function in bril JSON format.
+        func: a function in the internal IR (driver.ir.Function). Each
+            new name var.k is interned in func.names.
         dom_tree: dominator tree as returned by dominator_tree.
-        vars: dict of (str: List) pairs of var names and blocks where var is assigned.
+        vars: dict of (var: List) pairs of variable numbers and blocks where var is assigned.
+        blocks: optionally, the function's basic blocks, if already computed.
+        graph: optionally, the reachable cfg of those blocks.
     """
-    blocks, labels = basic_blocks(func["instrs"], quiet=True)
-    graph = reachable_cfg(cfg(blocks, labels), 0)
-    counters = {v: 0 for v in vars.keys()}  # current version of each var
-    stacks = {v: [] for v in vars.keys()}   # stack of versions of each var
+    if blocks is None:
+        blocks, labels = ir_basic_blocks(func.instrs)
+        graph = reachable_cfg(ir_cfg(blocks, labels), 0)
+    names = func.names
+    counters = {v: 0 for v in vars.keys()}  # next version of each var
+    stacks = {v: [] for v in vars.keys()}   # stack of the names of its versions
     gets = [[] for b in range(len(blocks))]
     # which variables each block has to get and what the new name is
-    defs_rename = [{} for b in range(len(blocks))]
-    # which variables each block defines and what the new name is
+    get_vars = [[instr.dest for instr in block if instr.op == GET]
+                for block in blocks]
+    # which variables each block gets, by their original name
+    out_names = [{} for b in range(len(blocks))]
+    # name of each variable a successor gets at the end of each block
+
+    assigned = {}  # block -> list of vars assigned in that block
+
+    def current_name(var):
+        stack = stacks.get(var)
+        # a function argument keeps its name (as does a never defined var)
+        return stack[-1] if stack else var
 
     def rename_block(b):
-        assigned_in_block = []  # list of (var, new_name) assigned in this block
+        assigned_in_block = assigned[b] = []  # vars assigned in this block
         for instr in blocks[b]:
-            if "args" in instr and instr["args"]:
-                new_args = []
-                for arg in instr["args"]:
-                    if stacks[arg][-1] >= 0:
-                        new_args.append(f"{arg}.{stacks[arg][-1]}")
-                    else:
-                        new_args.append(arg)
-                instr["args"] = new_args
-            if "dest" in instr:
-                var = instr["dest"]
-                new_name = f"{var}.{counters[var]}"
-                stacks[var].append(counters[var])
+            args = instr.args
+            if args:
+                for i, arg in enumerate(args):
+                    args[i] = current_name(arg)
+            var = instr.dest
+            if var != NO_VAR:
+                new_name = names.num(f"{names.names[var]}.{counters[var]}")
+                stacks[var].append(new_name)
                 counters[var] += 1
-                instr["dest"] = new_name
-                assigned_in_block.append((var, new_name))
-                if instr["op"] == "get":
+                instr.dest = new_name
+                assigned_in_block.append(var)
+                if instr.op == GET:
                     gets[b].append((var, new_name))
-        
-        for child in dom_tree.get(b, []):
-            rename_block(child)
-
-        for var, new_name in assigned_in_block:
-            defs_rename[b][var] = new_name
-            # might overwrite; this is intended; get last new_name used in block
-        
-        for var, _ in assigned_in_block:
+        for child in graph.get(b, []):
+            for var in get_vars[child]:
+                out_names[b][var] = current_name(var)
+
+    def finish_block(b):
+        # called once all of b's children in the dominator tree are renamed
+        for var in assigned.pop(b):
             stacks[var].pop()
-    
+
     for v in vars.keys():
         if -1 in vars[v]:  # function argument
-            stacks[v].append(-1)
-    rename_block(0)  # assuming entry block is 0
+            stacks[v].append(v)
+    for b, entering in walk(dom_tree, 0):  # assuming entry block is 0
+        if entering:
+            rename_block(b)
+        else:
+            finish_block(b)
 
     for b in range(len(blocks)):
         insert_pt = len(blocks[b])
-        if "op" in blocks[b][-1] and blocks[b][-1]["op"] in ("jmp", "br"):
+        if blocks[b][-1].op in (JMP, BR):
             insert_pt -= 1
-        for child in graph[b]:
+        for child in graph.get(b, []):
             for v, new_name in gets[child]:
-                blocks[b].insert(insert_pt,
-                {
-                    "op": "set",
-                    "args": [new_name, defs_rename[b][v]]
-                })
+                blocks[b].insert(insert_pt, Instr(SET, args=array("i", [new_name, out_names[b][v]])))
 
-    func["instrs"] = [instr for block in blocks for instr in block]
+    func.instrs = [instr for block in blocks for instr in block]
+
+def to_ssa_pruned(func, am) -> None:
+    """Convert a function in the internal IR to pruned SSA form in place.
+
+    Gets are only placed at the iterated dominance frontier of a variable's
+    definitions, and only where it is live. Variables that are live into the
+    entry block (i.e. undefined along some path) are defined there by undef,
+    so every use has a reaching definition.
+    """
+    instrs = func.instrs
+    if instrs[0].op == LABEL:
+        # the entry block must not have predecessors
+        labels = {instr.label for instr in instrs if instr.op == LABEL}
+        entry = "__entry__"
+        while entry in labels:
+            entry = "_" + entry
+        instrs.insert(0, Label(entry))
+        am.invalidate()
+    blocks, _ = am.get("blocks")
+    defs, _, types = get_defs_uses_types(func, blocks)
+    live_in = live_vars_ir(blocks, am.get("cfg"))
+    insert_pt = 1 if blocks[0][0].op == LABEL else 0
+    names = func.names.names
+    entry_live = [v for v in range(len(names)) if live_in[0] >> v & 1]
+    for var in sorted(entry_live, key=names.__getitem__):
+        if var in types and -1 not in defs[var]:
+            blocks[0].insert(insert_pt, Instr(UNDEF, var, types[var]))
+            defs[var].append(0)
+    add_phi_nodes_pruned(defs, types, blocks, am.get("dom_frontier"), live_in)
+    rename_vars(func, am.get("dom_tree"), defs, blocks, am.get("reachable_cfg"))
+    am.invalidate()
+
+def to_ssa_ir(func, am=None, pruned=False) -> None:
+    """Convert a function to SSA form in place.
+
+    Args:
+        func: a function in the internal IR (driver.ir.Function).
+        am: optionally, the FunctionAnalyses of func. Everything in it is
+            invalidated on return.
+        pruned: if True, build pruned SSA (see to_ssa_pruned) instead of
+            getting every variable in every block that might need it.
+    """
+    if am is None:
+        am = FunctionAnalyses(func)
+    if not func.instrs:
+        return
+    if pruned:
+        return to_ssa_pruned(func, am)
+    # add new entry block so it can set up the args
+    if func.instrs[0].op != LABEL:
+        func.instrs.insert(0, Label("__entry__")) # make space for set-only block
+        # nothing can jump to an unlabeled entry block, so only the blocks changed
+        am.invalidate(CFG_ANALYSES)
+    blocks, _ = am.get("blocks")
+    defs, uses, types = get_defs_uses_types(func, blocks)
+    # gets are inserted into the cached blocks, so rename_vars can reuse them
+    add_phi_nodes_new(func, defs, uses, types, blocks, am.get("preds"))
+    rename_vars(func, am.get("dom_tree"), defs, blocks, am.get("reachable_cfg"))
+    if func.args:
+        num = func.names.num
+        for v in func.args:
+            orig_name = v["name"]
+            func.instrs.insert(0, Instr(SET, args=array("i", [num(f"{orig_name}.0"), num(orig_name)])))
+    am.invalidate()
+
+def to_ssa(func, pruned=False) -> None:
+    """to_ssa_ir on a function in bril JSON format."""
+    ir_func = from_bril(func)
+    to_ssa_ir(ir_func, pruned=pruned)
+    func["instrs"] = to_bril(ir_func)["instrs"]
 
 if __name__ == "__main__":
     # parser = argparse.ArgumentParser()
@@ -223,20 +333,10 @@ if __name__ == "__main__":
     # args = parser.parse_args()
     # logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
 
-    full_bril = json.load(sys.stdin)
-    for func in full_bril["functions"]:
-        # add new entry block so it can set up the args
-        if "label" not in func["instrs"][0]:
-            func["instrs"].insert(0, {"label": "__entry__"}) # make space for set-only block
-        blocks, labels = basic_blocks(func["instrs"], quiet=True)
-        entry = 0  # Assuming the first block is the entry block
-        graph = reachable_cfg(cfg(blocks, labels), entry)
-        dom_tree = dominator_tree(graph, entry)
-        defs, uses, types = get_defs_uses_types(func)
-        add_phi_nodes_new(func, defs, uses, types)
-        rename_vars(func, dom_tree, defs)
-        if "args" in func:
-            for v in func["args"]:
-                orig_name = v["name"]
-                func["instrs"].insert(0, {"op": "set", "args": [f"{orig_name}.0", orig_name]})
-    print(json.dumps(full_bril))
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--pruned", action="store_true",
+                        help="place gets at the iterated dominance frontier, pruned by liveness")
+    args = parser.parse_args()
+
+    stream_functions(to_ssa, args.jobs, args.pruned)
\ No newline at end of file
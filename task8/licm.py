@@ -1,113 +1,163 @@
 import os, sys, json
+import argparse
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
-from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
-from task4.worklist import flip_cfg
-from task5.dominators import dominators
-from task8.natural_loops import natural_loops
-
-SIDE_EFFECT_OPS = ("call", "div", "set")
-
-def create_preheaders(func):
-    blocks, labels = basic_blocks(func["instrs"], quiet=True)
-    entry = 0  # Assuming the first block is the entry block
-    graph = reachable_cfg(cfg(blocks, labels), entry)
-    doms = dominators(graph, entry)
-    headers_loops = natural_loops(graph, doms)
-    reverse_graph = flip_cfg(graph)
-    for (h, l) in headers_loops:
-        outside_loop_preds = []
-        for i in reverse_graph[h]:
-            if i not in l:
-                outside_loop_preds.append(i)
-        if len(outside_loop_preds) != 1 or len(graph[outside_loop_preds[0]]) > 1:
-            # create preheader
-            label = blocks[h][0]["label"]
-            blocks[h].insert(0, {"label": label+"__preheader"})
-            # point everything to preheader instead
-            for b in outside_loop_preds:
-                if "labels" in blocks[b][-1]:
-                    idx = blocks[b][-1]["labels"].index(label)
-                    blocks[b][-1]["labels"][idx] = label+"__preheader"
-    func["instrs"] = [instr for block in blocks for instr in block]
-
-def single_loop_licm(all_blocks, cfg, doms, loop, preheader_idx):
-    loop = list(loop)
-    # add everything defined in loop to non-LI list
-    li_instrs = []
-    non_li_vars = set()
-    var_num_defs = {}
+from task5.mutable_cfg import MutableCFG
+from driver.analysis import FunctionAnalyses
+from driver.ir import from_bril, to_bril, OPCODE_NUMS, BR, JMP, NO_VAR
+from driver.stream import stream_functions
+
+# may trap, so only hoisted if they would run on every trip through the loop
+SIDE_EFFECT_OPS = frozenset(OPCODE_NUMS[op] for op in ("div",))
+# results depend on more than their arguments (calls and memory), or on the
+# block they are in (SSA gets), so they are never hoisted
+UNHOISTABLE_OPS = frozenset(OPCODE_NUMS[op] for op in ("call", "get", "undef", "alloc", "load"))
+
+def create_preheaders(func, am=None) -> bool:
+    """Give every loop of a driver.ir.Function without one a preheader.
+
+    The CFG is edited through a MutableCFG, which keeps the dominator tree
+    up to date and hands it back to am, so only the loops are recomputed.
+    """
+    if am is None:
+        am = FunctionAnalyses(func)
+    mutable_cfg = None
+    for loop in am.get("loop_forest").loops:
+        if loop.preheader is None:
+            if mutable_cfg is None:
+                mutable_cfg = MutableCFG.from_analyses(am)
+            mutable_cfg.insert_preheader(loop.header, loop.blocks)
+    if mutable_cfg is None:
+        return False
+    mutable_cfg.write_back(func, am)
+    return True
+
+def use_index(all_blocks) -> dict:
+    """Map each variable to {block: number of uses of it in that block}."""
     uses = {}
-    for block in loop:
-        for instr in all_blocks[block]:
-            if "dest" in instr:
-                non_li_vars.add(instr["dest"])
-                if instr["dest"] in var_num_defs:
-                    var_num_defs[instr["dest"]] += 1
-                else:
-                    var_num_defs[instr["dest"]] = 1
-            if "args" in instr:
-                for a in instr["args"]:
-                    if a in uses:
-                        uses[a].append(block)
-                    else:
-                        uses[a] = [block]
-    
-    exits = []
-    for block in loop:
-        if any([c not in loop for c in cfg[block]]):
-            exits.append(block)
-    used_outside_loop = set()
-    for i, block in enumerate(all_blocks):
-        if i not in loop:
-            for instr in block:
-                if "args" in instr:
-                    used_outside_loop.update(instr["args"])
-    # until convergence:
-    changed = True
-    while changed:
-        # add all unique-dest instrs with no non-LI args to LI instr list and remove from non_li
-        changed = False
-        for block in loop:
-            to_move_now = []
-            for j, instr in enumerate(all_blocks[block]):
-                unique_def = "dest" in instr and var_num_defs[instr["dest"]] == 1
-                dominates_uses = False
-                if "dest" in instr:
-                    if instr["dest"] not in uses:
-                        dominates_uses = True
-                    else:
-                        dominates_uses = all([block in doms[b] for b in uses[instr["dest"]]])
-                if (block, j) not in li_instrs and unique_def and dominates_uses:
-                    if "args" not in instr or all([a not in non_li_vars for a in instr["args"]]):
-                        # loop invariant instr
-                        move = False
-                        if all([block in doms[e] for e in exits]):
-                            move = True
-                        elif instr["op"] not in SIDE_EFFECT_OPS:
-                            if "dest" not in blocks[block][j] or blocks[block][j]["dest"] not in used_outside_loop:
-                                move = True
-                        if move:
-                            li_instrs.append((block,j))
-                            non_li_vars.remove(instr["dest"])
-                            to_move_now.append(j)
-                            changed = True
-            ph_end = len(all_blocks[preheader_idx])
-            for j in to_move_now[::-1]:
-                # delete jth element of block
-                # add it to the end of preheader
-                all_blocks[preheader_idx].insert(ph_end, all_blocks[block].pop(j))
+    for b, block in enumerate(all_blocks):
+        for instr in block:
+            for a in instr.args or ():
+                counts = uses.setdefault(a, {})
+                counts[b] = counts.get(b, 0) + 1
+    return uses
+
+def move_instr(instr, src, dst, uses) -> None:
+    """Update the use index for instr moving from block src to block dst."""
+    for a in instr.args or ():
+        counts = uses[a]
+        counts[src] -= 1
+        if not counts[src]:
+            del counts[src]
+        counts[dst] = counts.get(dst, 0) + 1
+
+def single_loop_licm(all_blocks, doms, loop, uses) -> None:
+    """Hoist the loop-invariant instructions of a Loop to its preheader.
+
+    An instruction is invariant if none of its arguments are defined in the
+    loop, other than by invariant instructions. Invariance is found with a
+    worklist over a def-use index of the loop, so each instruction is only
+    looked at a constant number of times per argument. uses is the
+    use_index of all_blocks, kept up to date as instructions move.
+    """
+    body = loop.blocks
+    exits = loop.exiting
+    num_defs = {}
+    loop_uses = {}  # var -> [(block, index)] of its uses in the loop
+    for b in body:
+        for j, instr in enumerate(all_blocks[b]):
+            if instr.dest != NO_VAR:
+                num_defs[instr.dest] = num_defs.get(instr.dest, 0) + 1
+            for a in instr.args or ():
+                loop_uses.setdefault(a, []).append((b, j))
+
+    dominates_exits = {}
+    def runs_every_trip(b):
+        if b not in dominates_exits:
+            dominates_exits[b] = all(b in doms[e] for e in exits)
+        return dominates_exits[b]
+
+    def hoistable(b, j):
+        instr = all_blocks[b][j]
+        dest = instr.dest
+        if instr.op in UNHOISTABLE_OPS or num_defs[dest] != 1:
+            return False
+        # every use in the loop must see this definition, not an older one
+        for ub, uj in loop_uses.get(dest, ()):
+            if b not in doms[ub] or (ub == b and uj <= j):
+                return False
+        if runs_every_trip(b):
+            return True
+        # otherwise the value must not escape and computing it must be harmless
+        return (instr.op not in SIDE_EFFECT_OPS
+                and all(u in body for u in uses.get(dest, ())))
+
+    # number of arguments of each instruction still defined in the loop by
+    # instructions not (yet) known to be invariant
+    pending = {}
+    worklist = []
+    for b in body:
+        for j, instr in enumerate(all_blocks[b]):
+            if instr.dest == NO_VAR:
+                continue
+            pending[(b, j)] = sum(1 for a in instr.args or () if a in num_defs)
+            if not pending[(b, j)] and hoistable(b, j):
+                worklist.append((b, j))
+
+    hoisted = []
+    while worklist:
+        b, j = worklist.pop()
+        hoisted.append((b, j))
+        for site in loop_uses.get(all_blocks[b][j].dest, ()):
+            if site in pending:
+                pending[site] -= 1
+                if not pending[site] and hoistable(*site):
+                    worklist.append(site)
+    if not hoisted:
+        return
+
+    # hoisted is in dependency order, so the moved instructions can be
+    # appended as they are, before the preheader's terminator (if any)
+    preheader = all_blocks[loop.preheader]
+    at = len(preheader)
+    if preheader and preheader[-1].op in (JMP, BR):
+        at -= 1
+    moved = set(hoisted)
+    for b, j in hoisted:
+        move_instr(all_blocks[b][j], b, loop.preheader, uses)
+    preheader[at:at] = [all_blocks[b][j] for b, j in hoisted]
+    for b in {b for b, _ in hoisted}:
+        all_blocks[b][:] = [instr for j, instr in enumerate(all_blocks[b]) if (b, j) not in moved]
+
+def licm_ir(func, am=None):
+    """Loop-invariant code motion on a driver.ir.Function, in place.
+
+    Loops are handled from the innermost out, so an instruction hoisted out
+    of an inner loop lands in a preheader inside the enclosing loop and can
+    then be hoisted out of that one too.
+    """
+    if am is None:
+        am = FunctionAnalyses(func)
+    # analyses are only recomputed if a preheader actually had to be added
+    create_preheaders(func, am)
+    blocks, _ = am.get("blocks")
+    doms = am.get("dominators")
+    uses = use_index(blocks)
+    # the forest lists nested loops before the loops enclosing them
+    for loop in am.get("loop_forest").loops:
+        if loop.preheader is not None:
+            single_loop_licm(blocks, doms, loop, uses)
+    func.instrs = [instr for block in blocks for instr in block]
+    am.invalidate()
+
+def licm(func):
+    """licm_ir on a function in bril JSON format."""
+    ir_func = from_bril(func)
+    licm_ir(ir_func)
+    func["instrs"] = to_bril(ir_func)["instrs"]
 
 if __name__ == "__main__":
-    full_bril = json.load(sys.stdin)
-    for func in full_bril["functions"]:
-        create_preheaders(func)
-        blocks, labels = basic_blocks(func["instrs"], quiet=True)
-        entry = 0  # Assuming the first block is the entry block
-        graph = reachable_cfg(cfg(blocks, labels), entry)
-        reverse_graph = flip_cfg(graph)
-        doms = dominators(graph, entry)
-        for l in natural_loops(graph, doms):
-            single_loop_licm(blocks, graph, doms, l[1], reverse_graph[l[0]][0])
-        func["instrs"] = [instr for block in blocks for instr in block]
-    print(json.dumps(full_bril))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1)
+    args = parser.parse_args()
+    stream_functions(licm, args.jobs)
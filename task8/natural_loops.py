@@ -5,56 +5,181 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
 from task4.worklist import flip_cfg
 from task2.cfg.cfg import basic_blocks, cfg, reachable_cfg
 from task5.dominators import dominators
+from task2.cfg.traversal import DepthFirstSearch
 
-def natural_loops(cfg, dominators):
+class Loop:
+    """A natural loop: a header and every block that can reach one of its
+    latches without passing through the header. Loops with the same header
+    are merged into one.
+
+    Attributes:
+        header: the loop's header block.
+        blocks: set of all blocks in the loop, including nested loops.
+        latches: blocks in the loop with an edge back to the header.
+        parent: the innermost loop enclosing this one, or None.
+        children: loops nested directly inside this one.
+        depth: nesting depth, 1 for an outermost loop.
+        exiting_edges: (u, v) edges from u in the loop to v outside it.
+        exits: blocks outside the loop that it can branch to.
+        preheader: the header's only predecessor outside the loop, if that
+            block has no other successor; otherwise None.
+        irreducible: True if the loop contains an irreducible region (see
+            LoopForest.irreducible_edges).
+    """
+    def __init__(self, header):
+        self.header = header
+        self.blocks = {header}
+        self.latches = []
+        self.parent = None
+        self.children = []
+        self.depth = 1
+        self.exiting_edges = []
+        self.exits = []
+        self.preheader = None
+        self.irreducible = False
+
+    @property
+    def exiting(self) -> list:
+        """Blocks in the loop with an edge leaving it."""
+        return list(dict.fromkeys(u for u, _ in self.exiting_edges))
+
+    def __repr__(self):
+        return f"Loop(header={self.header}, depth={self.depth}, blocks={sorted(self.blocks)})"
+
+class LoopForest:
+    """The loop nesting forest of a CFG.
+
+    Built in one pass over the loop headers, innermost first, in the style
+    of Havlak's algorithm: a union-find structure collapses every finished
+    loop into its header, so walking back from the latches of an enclosing
+    loop steps over each nested loop in one move.
+
+    Attributes:
+        loops: every loop, with nested loops before the loops enclosing them.
+        roots: the outermost loops.
+        innermost: dict mapping each block in some loop to the innermost
+            loop containing it.
+        irreducible_edges: retreating edges (u, v) of the depth-first walk
+            whose target v does not dominate u. These close cycles with more
+            than one entry, which are not natural loops and are not in loops.
+    """
+    def __init__(self, cfg, dominators, entry=0):
+        self.loops = []
+        self.roots = []
+        self.innermost = {}
+        self.irreducible_edges = []
+        if entry not in cfg:
+            return
+        dfs = DepthFirstSearch(cfg, entry)
+        preds = flip_cfg(cfg)
+
+        rep = {}  # union-find: block -> a block of the outermost loop found so far
+        def find(b):
+            root = b
+            while rep.get(root, root) != root:
+                root = rep[root]
+            while b != root:
+                rep[b], b = root, rep[b]
+            return root
+
+        by_header = {}
+        for h in reversed(dfs.preorder):  # inner headers come later in preorder
+            latches = [p for p in preds[h] if dfs.reachable(p) and h in dominators[p]]
+            if not latches:
+                continue
+            loop = Loop(h)
+            loop.latches = latches
+            by_header[h] = loop
+            own = []
+            seen = {h}
+            stack = [find(p) for p in latches]
+            while stack:
+                b = stack.pop()
+                if b in seen:
+                    continue
+                seen.add(b)
+                if b in by_header:
+                    # the header of a finished loop stands for all of it
+                    inner = by_header[b]
+                    inner.parent = loop
+                    loop.children.append(inner)
+                else:
+                    own.append(b)
+                rep[b] = h
+                for p in preds[b]:
+                    if dfs.reachable(p):
+                        r = find(p)
+                        if r not in seen:
+                            stack.append(r)
+            for b in own + [h]:
+                self.innermost[b] = loop
+            loop.blocks.update(own)
+            for inner in loop.children:
+                loop.blocks |= inner.blocks
+            self.loops.append(loop)
+
+        for loop in reversed(self.loops):  # outer loops first
+            if loop.parent is None:
+                self.roots.append(loop)
+            else:
+                loop.depth = loop.parent.depth + 1
+        for loop in self.loops:
+            for u in loop.blocks:
+                for v in cfg[u]:
+                    if v not in loop.blocks:
+                        loop.exiting_edges.append((u, v))
+            loop.exits = list(dict.fromkeys(v for _, v in loop.exiting_edges))
+            outside = [p for p in preds[loop.header] if p not in loop.blocks and dfs.reachable(p)]
+            if len(outside) == 1 and len(cfg[outside[0]]) == 1:
+                loop.preheader = outside[0]
+
+        for u in dfs.preorder:
+            for v in cfg[u]:
+                # v is a DFS ancestor of u (or u itself), but does not dominate it
+                retreating = dfs.pre[v] <= dfs.pre[u] and dfs.post[v] >= dfs.post[u]
+                if retreating and v not in dominators[u]:
+                    self.irreducible_edges.append((u, v))
+                    loop = self.common_loop(u, v)
+                    while loop is not None:
+                        loop.irreducible = True
+                        loop = loop.parent
+
+    def loop_of(self, block):
+        """The innermost loop containing block, or None."""
+        return self.innermost.get(block)
+
+    def depth(self, block) -> int:
+        """Loop nesting depth of block, 0 outside every loop."""
+        loop = self.innermost.get(block)
+        return loop.depth if loop is not None else 0
+
+    def common_loop(self, a, b):
+        """The innermost loop containing both a and b, or None."""
+        la, lb = self.loop_of(a), self.loop_of(b)
+        while la is not None and lb is not None and la is not lb:
+            if la.depth >= lb.depth:
+                la = la.parent
+            else:
+                lb = lb.parent
+        return la if la is lb else None
+
+    @property
+    def reducible(self) -> bool:
+        return not self.irreducible_edges
+
+def natural_loops(cfg, dominators, entry=0):
     """Get all the natural loops in a function.
 
     Args:
         cfg: the cfg of basic blocks in the function
         dominators: a map from each cfg node to the nodes which dominate it
+        entry: the entry node of cfg
 
     Returns:
-        A list of (node, Set[node]) for the header of each loop and all the nodes in it
+        A list of (node, Set[node]) for the header of each loop and all the
+        nodes in it, with nested loops before the loops enclosing them
     """
-    # from lesson 5 page:
-    # A natural loop is the smallest set of vertices L including A and B such that, 
-    # for every v in L, either all the predecessors of v are in L or v=B.
-    flipped_cfg = flip_cfg(cfg)
-    
-    # find all backedges
-    backedges = []
-    for u in cfg:
-        for v in cfg[u]:
-            if v in dominators[u]:
-                backedges.append((u,v))
-
-    loops = []
-    # for each: 
-    for u, v in backedges:
-        if u == v:
-            loops.append((u, {u}))
-            continue
-        # Add all predecessors of tail, and so on, and so on, until header is reached
-        loop_nodes = {u, v}
-        added = {u}
-        to_add = set()
-        while(len(added) > 0):
-            for n in added:
-                for p in flipped_cfg[n]:
-                    if p not in loop_nodes:
-                        to_add.add(p)
-            loop_nodes.update(to_add)
-            added = to_add
-            to_add = set()
-        loops.append((v, loop_nodes))
-    # merge all loops with the same header
-    loop_dict = {}
-    for l in loops:
-        if l[0] in loop_dict:
-            loop_dict[l[0]] |= l[1]
-        else:
-            loop_dict[l[0]] = l[1]
-    return list(loop_dict.items())
+    return [(l.header, l.blocks) for l in LoopForest(cfg, dominators, entry).loops]
 
 
 if __name__ == "__main__":
@@ -65,4 +190,8 @@ if __name__ == "__main__":
         graph = reachable_cfg(cfg(blocks, labels), entry)
         doms = dominators(graph, entry)
         print(labels)
-        print(natural_loops(graph, doms))
+        forest = LoopForest(graph, doms, entry)
+        for loop in forest.loops:
+            print(loop)
+        if not forest.reducible:
+            print("irreducible edges:", forest.irreducible_edges)